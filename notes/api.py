@@ -1,30 +1,192 @@
 import json
+from contextlib import contextmanager
+from importlib import import_module
+from itertools import islice
 
-from .store import notes_store_session
+from .bulk import read_notes, write_notes
+from .cache import SearchCache
+from .feed import Subscriptions
+from .query import QueryCache
+from .stats import NULL_STATS, Stats
+from .store import NotesStorePool
 
 
 class NotesAPI:
+    backends = {'sqlite': 'store.NotesStore', 'memory': 'memory.MemoryNotesStore', 'sharded': 'shards.ShardedNotesStore'}
+
+    def __init__(self, path=None, pool_size=1, backend='sqlite', cache_size=0, stats=False, slow_search_ms=None,
+                 shards=None, profile=None, probe_workers=None):
+        module, _, class_name = self.backends[backend].rpartition('.')
+        store_class = getattr(import_module('.' + module, __name__.rpartition('.')[0]), class_name)
+        if path is None:
+            path = store_class.default_path
+        self.stats = Stats(slow_search_ms) if stats or slow_search_ms is not None else NULL_STATS
+        store_options = dict((name, value) for name, value in
+                             (('shards', shards), ('profile', profile), ('probe_workers', probe_workers)) if value)
+        self.stores = NotesStorePool(path, pool_size, store_class=store_class, stats=self.stats,
+                                     store_options=store_options)
+        self.cache = SearchCache(cache_size) if cache_size else None
+        self.queries = QueryCache()
+        self.subscriptions = Subscriptions()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def create(self, payload):
-        with notes_store_session() as store:
-            store.update_note(json.loads(payload))
+        with self.stats.timer('api.create'):
+            self._update_note(json.loads(payload))
 
     def update(self, payload):
-        with notes_store_session() as store:
-            store.update_note(json.loads(payload))
+        with self.stats.timer('api.update'):
+            self._update_note(json.loads(payload))
 
     def delete(self, id):
-        with notes_store_session() as store:
+        with self.stats.timer('api.delete'), self.stores.session() as store:
+            previous_attrs = self._previous_attrs(store, id)
             store.delete_note(id)
+            if self.cache is not None:
+                self.cache.note_deleted(id, store.could_match, previous_attrs)
+
+    def export_notes(self, path):
+        with self.stats.timer('api.export'):
+            self.flush()
+            with self.stores.session() as store:
+                return write_notes(path, store.dump())
+
+    def import_notes(self, path):
+        with self.stats.timer('api.import'), self.stores.session() as store:
+            try:
+                return store.bulk_load(read_notes(path))
+            finally:
+                if self.cache is not None:
+                    self.cache.clear()
+
+    def explain(self, criteria):
+        query = self.queries.parse(criteria)
+        with self.stores.session() as store:
+            return store.explain(terms=list(query.terms), tags=list(query.tags))
 
     def search(self, criteria):
-        terms = []
-        tags = []
-        for criterion in criteria.split():
-            if criterion.startswith('tag:'):
-                tags.append(criterion[4:])
-            else:
-                terms.append(criterion)
-
-        with notes_store_session() as store:
-            return store.match_notes(terms=terms, tags=tags)
+        with self.stats.timer('api.search'):
+            return self._search(criteria)
+
+    def search_stream(self, criteria):
+        query = self.queries.parse(criteria)
+        if query.page.sort != 'id' or query.page.limit is not None:
+            return iter(self.search(criteria))
+        generation = None
+        if self.cache is not None:
+            ids = self.cache.result(query)
+            if ids is not None:
+                return iter(ids)
+            generation = self.cache.generation
+        if self.stores.batch_size > 1:
+            self.stores.flush()
+        return self._stream_matches(query, generation)
+
+    def search_many(self, criteria_list):
+        with self.stats.timer('api.search_many'):
+            queries = [self.queries.parse(criteria) for criteria in criteria_list]
+            results = {}
+            for query in set(queries):
+                ids = self.cache.result(query) if self.cache is not None else None
+                if ids is not None:
+                    results[query] = list(ids)
+
+            pending = [query for query in set(queries) if query not in results]
+            if pending:
+                generation = self.cache.generation if self.cache is not None else None
+                if self.stores.batch_size > 1:
+                    self.stores.flush()
+                with self.stores.session() as store:
+                    matches = store.match_many([(list(query.terms), list(query.tags), query.page, query.keys)
+                                                for query in pending])
+                for query, ids in zip(pending, matches):
+                    results[query] = ids
+                    if self.cache is not None:
+                        self.cache.store_result(query, ids, generation)
+
+            return [results[query] for query in queries]
+
+    def subscribe(self, criteria):
+        query = self.queries.parse(criteria)
+        if self.stores.batch_size > 1:
+            self.stores.flush()
+        with self.stores.session() as store:
+            return self.subscriptions.subscribe(store, query)
+
+    def changes(self, subscription_id):
+        with self.stats.timer('api.changes'):
+            if self.stores.batch_size > 1:
+                self.stores.flush()
+            with self.stores.session() as store:
+                return self.subscriptions.changes(store, int(subscription_id))
+
+    def unsubscribe(self, subscription_id):
+        self.subscriptions.unsubscribe(int(subscription_id))
+
+    def stats_report(self):
+        lines = self.stats.report()
+        if self.cache is not None:
+            lines.append('cache ' + ' '.join('{0}={1}'.format(*item) for item in sorted(self.cache.stats().items())))
+        return lines
+
+    @contextmanager
+    def ingest(self, batch_size=1000):
+        self.stores.batch_size = batch_size
+        try:
+            yield self
+        finally:
+            self.stores.batch_size = 1
+            self.stores.flush()
+
+    def flush(self):
+        self.stores.flush()
+
+    def close(self):
+        self.stores.close()
+
+    def _match_notes(self, query):
+        if self.stores.batch_size > 1:
+            self.stores.flush()
+        with self.stores.session() as store:
+            return store.match_notes(terms=list(query.terms), tags=list(query.tags), page=query.page, keys=query.keys)
+
+    def _stream_matches(self, query, generation):
+        streamed = [] if self.cache is not None else None
+        with self.stats.timer('api.search'), self.stores.session() as store:
+            ids = store.iter_matches(terms=list(query.terms), tags=list(query.tags), after=query.page.after,
+                                     keys=query.keys)
+            for id in islice(ids, query.page.offset, None):
+                if streamed is not None:
+                    streamed.append(id)
+                yield id
+        if streamed is not None:
+            self.cache.store_result(query, streamed, generation)
+
+    def _previous_attrs(self, store, id):
+        if self.cache is None:
+            return None
+        return store.fetch_notes([int(id)]).get(int(id))
+
+    def _search(self, criteria):
+        query = self.queries.parse(criteria)
+        if self.cache is None:
+            return self._match_notes(query)
+
+        ids = self.cache.result(query)
+        if ids is None:
+            generation = self.cache.generation
+            ids = self._match_notes(query)
+            self.cache.store_result(query, ids, generation)
+        return list(ids)
+
+    def _update_note(self, note_attrs):
+        with self.stores.session() as store:
+            previous_attrs = self._previous_attrs(store, note_attrs['id'])
+            store.update_note(note_attrs)
+            if self.cache is not None:
+                self.cache.note_changed(note_attrs, store.could_match, previous_attrs)
@@ -0,0 +1,278 @@
+import re
+from collections import namedtuple
+from heapq import nlargest, nsmallest
+
+from .stats import NULL_STATS
+
+
+PlanStep = namedtuple('PlanStep', 'field key is_prefix estimate')
+Page = namedtuple('Page', 'sort after offset limit')
+ALL_BY_ID = Page('id', None, 0, None)
+
+try:
+    _text_types = (str, unicode)
+except NameError:
+    _text_types = (str,)
+
+
+class BaseNotesStore(object):
+    default_path = None
+    max_prefix_expansion = 5000
+    poolable = True
+    stream_chunk_size = 1000
+    stats = NULL_STATS
+    _word_pattern = re.compile(r"\w+(?:'\w+)*", re.UNICODE)
+
+    def __init__(self, path=None, batch_size=1):
+        self.path = path
+        self.batch_size = batch_size
+
+
+    def close(self):
+        raise NotImplementedError()
+
+
+    def flush(self):
+        raise NotImplementedError()
+
+
+    def bulk_load(self, notes):
+        keep_revisions = self._is_empty()
+        batch_size, self.batch_size = self.batch_size, max(self.batch_size, 10000)
+        count = 0
+        try:
+            for note_attrs in notes:
+                self.update_note(note_attrs)
+                if keep_revisions and note_attrs.get('revision'):
+                    self._set_revision(note_attrs['id'], note_attrs['revision'])
+                count += 1
+        finally:
+            self.batch_size = batch_size
+            self.flush()
+        return count
+
+
+    def changes_since(self, revision):
+        raise NotImplementedError()
+
+
+    def dump(self):
+        raise NotImplementedError()
+
+
+    def fetch_notes(self, ids):
+        raise NotImplementedError()
+
+
+    def last_revision(self):
+        raise NotImplementedError()
+
+
+    def notes(self):
+        raise NotImplementedError()
+
+
+    def tags(self):
+        raise NotImplementedError()
+
+
+    def update_note(self, note_attrs):
+        raise NotImplementedError()
+
+
+    def delete_note(self, id):
+        raise NotImplementedError()
+
+
+    def could_match(self, note_attrs, terms=None, tags=None, keys=None):
+        content = note_attrs.get('content')
+        words = self._words(content) if content is not None else None
+        values = set(tag.lower() for tag in note_attrs['tag']) if note_attrs.get('tag') is not None else None
+        for field, key, is_prefix in self.query_keys(terms, tags) if keys is None else keys:
+            candidates = words if field == 'term' else values
+            if candidates is not None and not self._any_matches(candidates, key, is_prefix):
+                return False
+        return True
+
+
+    def explain(self, terms=None, tags=None):
+        lines = []
+        for n, step in enumerate(self.plan(terms, tags)):
+            key = '(no words)' if step.key is None else step.key + ('*' if step.is_prefix else '')
+            lines.append('{0}. {1} {2} (estimated {3} notes)'.format(n + 1, step.field, key, step.estimate))
+        return lines
+
+
+    def match_many(self, queries):
+        with self.stats.timer('store.match_many'):
+            queries = [(query[3] if len(query) > 3 else self.query_keys(query[0], query[1]),
+                        query[2] if len(query) > 2 else ALL_BY_ID) for query in queries]
+            postings = {}
+            for keys, page in queries:
+                for field, key, is_prefix in keys:
+                    if (field, key, is_prefix) not in postings:
+                        postings[field, key, is_prefix] = set() if key is None else \
+                            self._matching_ids(PlanStep(field, key, is_prefix, None), None)
+
+            results = []
+            for keys, page in queries:
+                ids = None
+                for id_set in sorted((postings[key] for key in keys), key=len):
+                    ids = id_set if ids is None else ids.intersection(id_set)
+                    if not ids:
+                        break
+                results.append(self._page(ids or (), page))
+            return results
+
+
+    def iter_matches(self, terms=None, tags=None, after=None, keys=None):
+        with self.stats.search(terms, tags) as trace:
+            with self.stats.timer('store.plan'):
+                plan = self.plan(terms, tags, keys)
+            if not plan or any(step.key is None for step in plan):
+                return
+            counts = [0] * len(plan)
+            try:
+                for chunk in self._matching_chunks(plan[0], after):
+                    ids = set(chunk)
+                    counts[0] += len(ids)
+                    with self.stats.timer('store.fetch'):
+                        for n, step in enumerate(plan[1:], 1):
+                            ids = self._matching_ids(step, ids)
+                            counts[n] += len(ids)
+                            if not ids:
+                                break
+                    for id in sorted(ids):
+                        yield id
+            finally:
+                for step, count in zip(plan, counts):
+                    trace.append((step, count))
+
+
+    def match_notes(self, terms=None, tags=None, page=ALL_BY_ID, keys=None):
+        with self.stats.search(terms, tags) as trace:
+            with self.stats.timer('store.plan'):
+                plan = self.plan(terms, tags, keys)
+            ids = None
+            for n, step in enumerate(plan):
+                with self.stats.timer('store.fetch'):
+                    if step.key is None:
+                        ids = set()
+                    elif n == len(plan) - 1 and page.sort == 'id' and page.limit is not None:
+                        ids = self._first_matching_ids(step, ids, page.after, page.offset + page.limit)
+                    else:
+                        ids = self._matching_ids(step, ids)
+                trace.append((step, len(ids)))
+                if not ids:
+                    return []
+            return self._page(ids or (), page)
+
+
+    def plan(self, terms=None, tags=None, keys=None):
+        steps = [PlanStep(field, key, is_prefix, self._estimate(field, key, is_prefix) if key is not None else 0)
+                 for field, key, is_prefix in (self.query_keys(terms, tags) if keys is None else keys)]
+        return sorted(steps, key=lambda step: step.estimate)
+
+
+    @classmethod
+    def query_keys(cls, terms, tags):
+        keys = [('term', word, is_prefix) for word, is_prefix in cls._search_words(terms or ())]
+        keys += [('tag', value, is_prefix) for value, is_prefix in cls._search_tags(tags or ())]
+        return tuple(keys)
+
+
+    def _any_matches(self, values, key, is_prefix):
+        if key is None:
+            return False
+        if not is_prefix:
+            return key in values
+        return any(value.startswith(key) for value in values)
+
+
+    @classmethod
+    def _check_note(cls, note_attrs):
+        content = note_attrs.get('content')
+        if content is not None and not isinstance(content, _text_types):
+            raise ValueError('note {0}: content must be text'.format(note_attrs['id']))
+        if 'tag' in note_attrs:
+            tags = note_attrs['tag']
+            if not isinstance(tags, (list, tuple)) or not all(isinstance(tag, _text_types) for tag in tags):
+                raise ValueError('note {0}: tag must be a list of text'.format(note_attrs['id']))
+
+
+    def _estimate(self, field, key, is_prefix):
+        raise NotImplementedError()
+
+
+    def _first_matching_ids(self, step, candidates, after, count):
+        ids = self._matching_ids(step, candidates)
+        return nsmallest(count, ids if after is None else (id for id in ids if id > after))
+
+
+    def _is_empty(self):
+        raise NotImplementedError()
+
+
+    def _matching_chunks(self, step, after):
+        while True:
+            ids = self._first_matching_ids(step, None, after, self.stream_chunk_size)
+            if ids:
+                yield ids
+            if len(ids) < self.stream_chunk_size:
+                return
+            after = ids[-1]
+
+
+    def _matching_ids(self, step, candidates):
+        raise NotImplementedError()
+
+
+    def _page(self, ids, page):
+        count = None if page.limit is None else page.offset + page.limit
+        if page.sort == 'recent':
+            revisions = self._revisions(ids)
+            key = lambda id: (revisions[id], id)
+            ids = sorted(ids, key=key, reverse=True) if count is None else nlargest(count, ids, key=key)
+        else:
+            if page.after is not None:
+                ids = [id for id in ids if id > page.after]
+            ids = sorted(ids) if count is None else nsmallest(count, ids)
+        return ids[page.offset:]
+
+
+    def _revisions(self, ids):
+        raise NotImplementedError()
+
+
+    def _set_revision(self, id, revision):
+        raise NotImplementedError()
+
+
+    @classmethod
+    def _search_tags(cls, tags):
+        for tag in tags:
+            value = tag.lower()
+            yield (value.rstrip('*'), True) if value.endswith('*') else (value, False)
+
+
+    @classmethod
+    def _search_words(cls, terms):
+        for term in terms:
+            words = cls._words_in_order(term)
+            is_prefix = term.endswith('*')
+            if not words:
+                yield ('', True) if is_prefix else (None, False)
+            for n, word in enumerate(words):
+                yield word, is_prefix and n == len(words) - 1
+
+
+    @classmethod
+    def _words(cls, text):
+        return set(cls._words_in_order(text))
+
+
+    @classmethod
+    def _words_in_order(cls, text):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        return cls._word_pattern.findall(text.lower())
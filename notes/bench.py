@@ -0,0 +1,183 @@
+import json
+import random
+import subprocess
+from bisect import bisect
+from collections import defaultdict
+from string import ascii_lowercase
+from timeit import default_timer
+
+from .protocol import execute
+
+
+class Workload(object):
+    def __init__(self, notes=1000, commands=10000, vocabulary=5000, zipf=1.1, words_per_note=20,
+                 tags=50, tags_per_note=2, search_ratio=0.8, update_ratio=0.1, delete_ratio=0.05,
+                 prefix_ratio=0.2, tag_ratio=0.3, seed=0):
+        self.notes = notes
+        self.commands = commands
+        self.vocabulary = vocabulary
+        self.zipf = zipf
+        self.words_per_note = words_per_note
+        self.tags = tags
+        self.tags_per_note = tags_per_note
+        self.search_ratio = search_ratio
+        self.update_ratio = update_ratio
+        self.delete_ratio = delete_ratio
+        self.prefix_ratio = prefix_ratio
+        self.tag_ratio = tag_ratio
+        self.seed = seed
+
+
+    def __iter__(self):
+        rng = random.Random(self.seed)
+        words = _Zipf([_word(n) for n in range(self.vocabulary)], self.zipf)
+        tags = _Zipf([_word(n, 'tag') for n in range(self.tags)], self.zipf)
+        live = []
+
+        for id in range(1, self.notes + 1):
+            live.append(id)
+            yield 'create', self._note(rng, id, words, tags)
+
+        next_id = self.notes + 1
+        for n in range(self.commands):
+            roll = rng.random()
+            if roll < self.search_ratio:
+                yield 'search', self._query(rng, words, tags)
+            elif roll < self.search_ratio + self.update_ratio and live:
+                yield 'update', self._note(rng, rng.choice(live), words, tags)
+            elif roll < self.search_ratio + self.update_ratio + self.delete_ratio and live:
+                yield 'delete', str(live.pop(rng.randrange(len(live))))
+            else:
+                live.append(next_id)
+                yield 'create', self._note(rng, next_id, words, tags)
+                next_id += 1
+
+
+    def params(self):
+        return dict(self.__dict__)
+
+
+    def write(self, stream):
+        for command, argument in self:
+            stream.write('{0}\n{1}\n'.format(command.upper(), argument))
+
+
+    def _note(self, rng, id, words, tags):
+        return json.dumps({'id': str(id),
+                           'tag': sorted(set(tags.sample(rng) for n in range(self.tags_per_note))),
+                           'content': ' '.join(words.sample(rng) for n in range(self.words_per_note))})
+
+
+    def _query(self, rng, words, tags):
+        criteria = []
+        for n in range(rng.randint(1, 3)):
+            if rng.random() < self.tag_ratio:
+                criteria.append('tag:' + tags.sample(rng))
+            else:
+                criteria.append(words.sample(rng))
+            if rng.random() < self.prefix_ratio:
+                criteria[-1] = criteria[-1][:max(len(criteria[-1]) - 2, 1)] + '*'
+        return ' '.join(criteria)
+
+
+
+class _Zipf(object):
+    def __init__(self, values, skew):
+        self.values = values
+        self._cumulative = []
+        total = 0.0
+        for rank in range(1, len(values) + 1):
+            total += 1.0 / rank ** skew
+            self._cumulative.append(total)
+
+
+    def sample(self, rng):
+        return self.values[min(bisect(self._cumulative, rng.random() * self._cumulative[-1]),
+                               len(self.values) - 1)]
+
+
+
+def run(api, commands):
+    timings = defaultdict(list)
+    started = default_timer()
+    for command, argument in commands:
+        before = default_timer()
+        execute(api, command, argument)
+        timings[command].append(default_timer() - before)
+    api.flush()
+    elapsed = default_timer() - started
+
+    report = {'elapsed': elapsed,
+              'throughput': sum(len(times) for times in timings.values()) / elapsed if elapsed else 0.0,
+              'commands': {}}
+    for command, times in timings.items():
+        times.sort()
+        report['commands'][command] = {
+            'count': len(times),
+            'throughput': len(times) / sum(times) if sum(times) else 0.0,
+            'mean': sum(times) / len(times),
+            'p50': _percentile(times, 50),
+            'p95': _percentile(times, 95),
+            'p99': _percentile(times, 99),
+        }
+    return report
+
+
+def time_to_first_result(argv, commands, runs=20):
+    times = []
+    for n in range(runs):
+        started = default_timer()
+        process = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        process.stdin.write(commands.encode('utf-8'))
+        process.stdin.close()
+        process.stdout.readline()
+        times.append(default_timer() - started)
+        process.stdout.read()
+        process.wait()
+    times.sort()
+    return {'runs': runs, 'mean': sum(times) / runs, 'p50': _percentile(times, 50), 'p95': _percentile(times, 95)}
+
+
+def compare(baseline, current):
+    lines = []
+    for command in sorted(set(baseline['commands']) & set(current['commands'])):
+        before = baseline['commands'][command]
+        after = current['commands'][command]
+        lines.append('{0:8} '.format(command.upper()) + '  '.join(
+            '{0} {1:+.1%}'.format(stat, (after[stat] - before[stat]) / before[stat] if before[stat] else 0.0)
+            for stat in ('throughput', 'p50', 'p95', 'p99')))
+    return lines
+
+
+def summarize(report):
+    lines = ['{0:8} {1:>8} {2:>12} {3:>10} {4:>10} {5:>10}'.format('command', 'count', 'ops/s', 'p50 ms',
+                                                                   'p95 ms', 'p99 ms')]
+    for command, stats in sorted(report['commands'].items()):
+        lines.append('{0:8} {1:8d} {2:12.1f} {3:10.3f} {4:10.3f} {5:10.3f}'.format(
+            command.upper(), stats['count'], stats['throughput'],
+            stats['p50'] * 1000, stats['p95'] * 1000, stats['p99'] * 1000))
+    lines.append('{0} commands in {1:.2f}s, {2:.1f} ops/s'.format(
+        sum(stats['count'] for stats in report['commands'].values()), report['elapsed'], report['throughput']))
+    return lines
+
+
+def summarize_startup(report):
+    lines = ['{0:8} {1:>8} {2:>10} {3:>10} {4:>10}'.format('startup', 'runs', 'mean ms', 'p50 ms', 'p95 ms')]
+    for mode, stats in sorted(report['startup'].items()):
+        lines.append('{0:8} {1:8d} {2:10.1f} {3:10.1f} {4:10.1f}'.format(
+            mode, stats['runs'], stats['mean'] * 1000, stats['p50'] * 1000, stats['p95'] * 1000))
+    return lines
+
+
+def _percentile(sorted_times, percent):
+    return sorted_times[max(int(round(percent / 100.0 * len(sorted_times))) - 1, 0)]
+
+
+def _word(n, prefix=''):
+    letters = []
+    while True:
+        n, letter = divmod(n, len(ascii_lowercase))
+        letters.append(ascii_lowercase[letter])
+        if not n:
+            break
+    return prefix + ''.join(reversed(letters)).rjust(3, 'a')
@@ -0,0 +1,53 @@
+import mmap
+import os
+import struct
+
+
+MAGIC = b'NOTESv1\n'
+
+_record = struct.Struct('<qqII')
+_tag_length = struct.Struct('<H')
+
+
+def read_notes(path):
+    with open(path, 'rb') as stream:
+        data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('{0} is not a notes export'.format(path))
+        offset = len(MAGIC)
+        while offset < len(data):
+            id, revision, content_length, tag_count = _record.unpack_from(data, offset)
+            offset += _record.size
+            content = data[offset:offset + content_length].decode('utf-8')
+            offset += content_length
+            tags = []
+            for n in range(tag_count):
+                length, = _tag_length.unpack_from(data, offset)
+                offset += _tag_length.size
+                tags.append(data[offset:offset + length].decode('utf-8'))
+                offset += length
+            yield {'id': id, 'content': content, 'tag': tags, 'revision': revision}
+    finally:
+        data.close()
+
+
+def write_notes(path, notes):
+    count = 0
+    with open(path + '.tmp', 'wb') as stream:
+        stream.write(MAGIC)
+        for note_attrs in notes:
+            content = _encode(note_attrs.get('content') or u'')
+            tags = [_encode(tag) for tag in note_attrs.get('tag') or ()]
+            stream.write(_record.pack(int(note_attrs['id']), note_attrs.get('revision') or 0, len(content), len(tags)))
+            stream.write(content)
+            for tag in tags:
+                stream.write(_tag_length.pack(len(tag)))
+                stream.write(tag)
+            count += 1
+    os.rename(path + '.tmp', path)
+    return count
+
+
+def _encode(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from threading import Lock
+
+from .base import ALL_BY_ID
+
+
+class LRUCache(object):
+    def __init__(self, size=1024):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def get(self, key, default=None):
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+
+    def put(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+
+    def items(self):
+        return list(self._entries.items())
+
+
+
+class SearchCache(object):
+    def __init__(self, size=1024):
+        self.results = LRUCache(size)
+        self.generation = 0
+        self._lock = Lock()
+
+
+    def result(self, query):
+        with self._lock:
+            entry = self.results.get(query)
+            return None if entry is None else entry[0]
+
+
+    def store_result(self, query, ids, generation):
+        with self._lock:
+            if generation == self.generation:
+                self.results.put(query, (tuple(ids), frozenset(ids)))
+
+
+    def note_changed(self, note_attrs, could_match, previous_attrs=None):
+        id = _note_id(note_attrs['id'])
+        with self._lock:
+            self.generation += 1
+            for query, (ids, id_set) in self.results.items():
+                if id in id_set or could_match(note_attrs, query[0], query[1], getattr(query, 'keys', None)) or \
+                        _shifts_page(query, previous_attrs, could_match):
+                    self.results.discard(query)
+
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            for query, ids in self.results.items():
+                self.results.discard(query)
+
+
+    def note_deleted(self, id, could_match=None, previous_attrs=None):
+        id = _note_id(id)
+        with self._lock:
+            self.generation += 1
+            for query, (ids, id_set) in self.results.items():
+                if id in id_set or _shifts_page(query, previous_attrs, could_match):
+                    self.results.discard(query)
+
+
+    def stats(self):
+        return {'hits': self.results.hits, 'misses': self.results.misses,
+                'entries': len(self.results), 'size': self.results.size}
+
+
+
+def _shifts_page(query, previous_attrs, could_match):
+    if previous_attrs is None or getattr(query, 'page', ALL_BY_ID) == ALL_BY_ID:
+        return False
+    return could_match(previous_attrs, query[0], query[1], getattr(query, 'keys', None))
+
+
+def _note_id(id):
+    try:
+        return int(id)
+    except ValueError:
+        return id
@@ -0,0 +1,37 @@
+import socket
+from threading import Thread
+
+
+def forward(address, lines, output, autoflush=False):
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    client = socket.socket(family, socket.SOCK_STREAM)
+    client.connect(address)
+    try:
+        responses = Thread(target=_copy_responses, args=(client, output, autoflush))
+        responses.daemon = True
+        responses.start()
+        for line in lines:
+            client.sendall(line if isinstance(line, bytes) else line.encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        responses.join()
+    finally:
+        client.close()
+
+
+def parse_address(address):
+    if address.startswith('unix:'):
+        return address[5:]
+    host, _, port = address.rpartition(':')
+    return host, int(port)
+
+
+def _copy_responses(client, output, autoflush):
+    stream = client.makefile('rb')
+    try:
+        for line in iter(stream.readline, b''):
+            output.write(line if isinstance(line, str) else line.decode('utf-8'))
+            if autoflush:
+                output.flush()
+    finally:
+        stream.close()
+        output.flush()
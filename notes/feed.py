@@ -0,0 +1,70 @@
+from threading import Lock
+
+from .base import ALL_BY_ID
+
+
+class Subscription(object):
+    __slots__ = ('query', 'revision', 'ids')
+
+    def __init__(self, query, revision, ids):
+        self.query = query
+        self.revision = revision
+        self.ids = ids
+
+
+
+class Subscriptions(object):
+    def __init__(self):
+        self._subscriptions = {}
+        self._next_id = 1
+        self._lock = Lock()
+
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+
+    def subscribe(self, store, query):
+        if not query.keys:
+            raise ValueError('nothing to search for')
+        if query.page != ALL_BY_ID:
+            raise ValueError('subscriptions follow the whole result; drop limit:, offset:, after: and sort:')
+
+        with self._lock:
+            revision = store.last_revision()
+            ids = set(store.match_notes(terms=list(query.terms), tags=list(query.tags), keys=query.keys))
+            id = self._next_id
+            self._next_id += 1
+            self._subscriptions[id] = Subscription(query, revision, ids)
+        return id, revision
+
+
+    def unsubscribe(self, id):
+        with self._lock:
+            if self._subscriptions.pop(id, None) is None:
+                raise ValueError('unknown subscription {0}'.format(id))
+
+
+    def changes(self, store, id):
+        with self._lock:
+            subscription = self._subscriptions.get(id)
+            if subscription is None:
+                raise ValueError('unknown subscription {0}'.format(id))
+
+            query = subscription.query
+            revision = store.last_revision()
+            changed = store.changes_since(subscription.revision)
+            notes = store.fetch_notes(changed)
+            entered = []
+            left = []
+            for note_id in changed:
+                note_attrs = notes.get(note_id)
+                matches = note_attrs is not None and store.could_match(note_attrs, query.terms, query.tags, query.keys)
+                if matches and note_id not in subscription.ids:
+                    subscription.ids.add(note_id)
+                    entered.append(note_id)
+                elif not matches and note_id in subscription.ids:
+                    subscription.ids.discard(note_id)
+                    left.append(note_id)
+            subscription.revision = max(subscription.revision, revision)
+        return revision, sorted(entered), sorted(left)
@@ -0,0 +1,240 @@
+import os
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from time import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .base import BaseNotesStore
+from .postings import PostingList, first_ids
+
+
+class _Note(object):
+    __slots__ = ('id', 'content', 'tags', 'revision')
+
+    def __init__(self, id, content='', tags=()):
+        self.id = id
+        self.content = content
+        self.tags = tags
+        self.revision = 0
+
+
+class MemoryNotesStore(BaseNotesStore):
+    poolable = False
+
+    def __init__(self, path=None, batch_size=1):
+        super(MemoryNotesStore, self).__init__(path, batch_size)
+        self._notes = {}
+        self._last_revision = 0
+        self._term_postings = {}
+        self._tag_postings = {}
+        self._changes = OrderedDict()
+        if path and os.path.isfile(path):
+            self._load_snapshot()
+        self._terms = sorted(self._term_postings)
+        self._tags = sorted(self._tag_postings)
+
+
+    def close(self):
+        if self.path:
+            self.save_snapshot()
+
+
+    def flush(self):
+        pass
+
+
+    def save_snapshot(self):
+        with open(self.path + '.tmp', 'wb') as snapshot:
+            pickle.dump((self._notes, self._term_postings, self._tag_postings, self._changes), snapshot,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(self.path + '.tmp', self.path)
+
+
+    def changes_since(self, revision):
+        ids = []
+        for id in reversed(self._changes):
+            if self._changes[id] <= revision:
+                break
+            ids.append(id)
+        return ids
+
+
+    def bulk_load(self, notes):
+        count = super(MemoryNotesStore, self).bulk_load(notes)
+        notes = sorted(self._notes.values(), key=lambda note: note.revision)
+        deleted = [(id, revision) for id, revision in self._changes.items() if id not in self._notes]
+        self._changes = OrderedDict(sorted(deleted + [(note.id, note.revision) for note in notes],
+                                           key=lambda change: change[1]))
+        return count
+
+
+    def dump(self):
+        return ({'id': note.id, 'content': note.content, 'tag': list(note.tags),
+                 'revision': getattr(note, 'revision', 0)}
+                for note in sorted(self._notes.values(), key=lambda note: note.id))
+
+
+    def fetch_notes(self, ids):
+        notes = (self._notes.get(id) for id in ids)
+        return dict((note.id, {'id': note.id, 'content': note.content, 'tag': list(note.tags)})
+                    for note in notes if note is not None)
+
+
+    def last_revision(self):
+        return self._last_revision
+
+
+    def notes(self):
+        return ({'id': note.id, 'content': note.content} for note in self._notes.values())
+
+
+    def tags(self):
+        values = sorted(set(tag for note in self._notes.values() for tag in note.tags))
+        return ({'id': n + 1, 'value': value} for n, value in enumerate(values))
+
+
+    def update_note(self, note_attrs):
+        self._check_note(note_attrs)
+        id = int(note_attrs['id'])
+        note = self._notes.get(id)
+        changed = note is None
+        if note is None:
+            note = self._notes[id] = _Note(id)
+
+        if note_attrs.get('content') is not None and note_attrs['content'] != note.content:
+            self._repost(self._term_postings, self._terms, self._words(note.content),
+                         self._words(note_attrs['content']), id)
+            note.content = note_attrs['content']
+            changed = True
+
+        if 'tag' in note_attrs:
+            tags = tuple(sorted(set(note_attrs['tag'])))
+            if tags != note.tags:
+                self._repost(self._tag_postings, self._tags, set(tag.lower() for tag in note.tags),
+                             set(tag.lower() for tag in tags), id)
+                note.tags = tags
+                changed = True
+
+        if changed:
+            note.revision = self._record_change(id)
+
+
+    def delete_note(self, id):
+        note = self._notes.pop(int(id), None)
+        if note is not None:
+            self._unpost(self._term_postings, self._terms, self._words(note.content), note.id)
+            self._unpost(self._tag_postings, self._tags, set(tag.lower() for tag in note.tags), note.id)
+            self._record_change(note.id)
+
+
+    def _estimate(self, field, key, is_prefix):
+        postings, keys = self._index(field)
+        if not is_prefix:
+            return len(postings.get(key, ()))
+        values = self._capped_expansion(keys, key)
+        estimate = sum(len(postings[value]) for value in values)
+        return estimate if len(values) <= self.max_prefix_expansion else max(estimate, len(self._notes))
+
+
+    def _capped_expansion(self, keys, prefix):
+        return list(islice(self._expand(keys, prefix), self.max_prefix_expansion + 1))
+
+
+    def _expand(self, keys, prefix):
+        n = bisect_left(keys, prefix)
+        while n < len(keys) and keys[n].startswith(prefix):
+            yield keys[n]
+            n += 1
+
+
+    def _index(self, field):
+        if field == 'tag':
+            return self._tag_postings, self._tags
+        return self._term_postings, self._terms
+
+
+    def _is_empty(self):
+        return not self._notes
+
+
+    def _load_snapshot(self):
+        with open(self.path, 'rb') as stream:
+            snapshot = pickle.load(stream)
+        self._notes, self._term_postings, self._tag_postings = snapshot[:3]
+        if len(snapshot) > 3:
+            self._changes = snapshot[3]
+        else:
+            notes = sorted(self._notes.values(), key=lambda note: getattr(note, 'revision', 0))
+            self._changes = OrderedDict((note.id, getattr(note, 'revision', 0)) for note in notes)
+        self._last_revision = max(self._changes.values() or [0])
+        for postings in (self._term_postings, self._tag_postings):
+            for value, ids in postings.items():
+                if not isinstance(ids, PostingList):
+                    postings[value] = PostingList(ids)
+
+
+    def _first_matching_ids(self, step, candidates, after, count):
+        if candidates is None and step.is_prefix:
+            postings, keys = self._index(step.field)
+            values = self._capped_expansion(keys, step.key)
+            if len(values) <= self.max_prefix_expansion:
+                return first_ids([self._first_posted(postings[value].ids, after, count) for value in values], count)
+
+        ids = self._matching_ids(step, candidates).ids
+        return list(self._first_posted(ids, after, count))
+
+
+    def _first_posted(self, ids, after, count):
+        start = 0 if after is None else bisect_right(ids, after)
+        return ids[start:start + count]
+
+
+    def _matching_ids(self, step, candidates):
+        postings, keys = self._index(step.field)
+        if not step.is_prefix:
+            ids = postings.get(step.key, PostingList())
+        else:
+            ids = PostingList.union(postings[value] for value in self._expand(keys, step.key))
+        return ids if candidates is None else candidates.intersection(ids)
+
+
+    def _post(self, postings, keys, values, id):
+        for value in values:
+            if value not in postings:
+                postings[value] = PostingList()
+                insort(keys, value)
+            postings[value].add(id)
+
+
+    def _repost(self, postings, keys, old_values, values, id):
+        self._unpost(postings, keys, old_values - values, id)
+        self._post(postings, keys, values - old_values, id)
+
+
+    def _record_change(self, id):
+        self._last_revision = max(self._last_revision + 1, int(time() * 1000000))
+        self._changes.pop(id, None)
+        self._changes[id] = self._last_revision
+        return self._last_revision
+
+
+    def _revisions(self, ids):
+        return dict((id, getattr(self._notes[id], 'revision', 0)) for id in ids)
+
+
+    def _set_revision(self, id, revision):
+        self._notes[int(id)].revision = revision
+
+
+    def _unpost(self, postings, keys, values, id):
+        for value in values:
+            ids = postings[value]
+            ids.discard(id)
+            if not ids:
+                del postings[value]
+                del keys[bisect_left(keys, value)]
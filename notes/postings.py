@@ -0,0 +1,108 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import chain
+
+
+class PostingList(object):
+    __slots__ = ('ids',)
+
+    def __init__(self, ids=()):
+        self.ids = _compact(sorted(set(ids)))
+
+    def __contains__(self, id):
+        n = bisect_left(self.ids, id)
+        return n < len(self.ids) and self.ids[n] == id
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __nonzero__(self):
+        return len(self.ids) > 0
+
+    __bool__ = __nonzero__
+
+    def __eq__(self, other):
+        return isinstance(other, PostingList) and list(self.ids) == list(other.ids)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'PostingList({0!r})'.format(list(self.ids))
+
+    @property
+    def typecode(self):
+        return getattr(self.ids, 'typecode', None)
+
+    def add(self, id):
+        n = bisect_left(self.ids, id)
+        if n < len(self.ids) and self.ids[n] == id:
+            return
+        try:
+            self.ids.insert(n, id)
+        except OverflowError:
+            self.ids = _compact(list(self.ids[:n]) + [id] + list(self.ids[n:]))
+
+    def discard(self, id):
+        n = bisect_left(self.ids, id)
+        if n < len(self.ids) and self.ids[n] == id:
+            del self.ids[n]
+
+    def intersection(self, other):
+        small, large = sorted((self.ids, other.ids), key=len)
+        ids = []
+        n = 0
+        for id in small:
+            n = _gallop(large, id, n)
+            if n == len(large):
+                break
+            if large[n] == id:
+                ids.append(id)
+                n += 1
+        return _wrap(_compact(ids))
+
+    @staticmethod
+    def union(posting_lists):
+        posting_lists = list(posting_lists)
+        if len(posting_lists) == 1:
+            return posting_lists[0]
+        return _wrap(_compact(sorted(set(chain.from_iterable(posting_lists)))))
+
+
+def first_ids(sorted_ids, count):
+    ids = []
+    for id in merge(*sorted_ids):
+        if len(ids) == count:
+            break
+        if not ids or id != ids[-1]:
+            ids.append(id)
+    return ids
+
+
+def _compact(ids):
+    for typecode in ('I', 'L'):
+        try:
+            return array(typecode, ids)
+        except OverflowError:
+            pass
+    return list(ids)
+
+
+def _gallop(ids, id, lo):
+    hi = lo
+    step = 1
+    while hi < len(ids) and ids[hi] < id:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(ids, id, lo, min(hi, len(ids)))
+
+
+def _wrap(ids):
+    posting_list = PostingList.__new__(PostingList)
+    posting_list.ids = ids
+    return posting_list
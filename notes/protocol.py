@@ -0,0 +1,78 @@
+from itertools import islice
+
+
+formatters = {
+    'changes': lambda changes: '{0}; {1}; {2}'.format(changes[0], _ids(changes[1]), _ids(changes[2])),
+    'create': None,
+    'update': None,
+    'delete': None,
+    'explain': lambda lines: '\n'.join(lines),
+    'export': None,
+    'import': None,
+    'search': lambda ids: _ids(ids),
+    'stats': lambda lines: '\n'.join(lines),
+    'subscribe': lambda subscription: '{0} {1}'.format(*subscription),
+    'unsubscribe': None,
+}
+
+bare_commands = {'stats': 'stats_report'}
+
+api_methods = {'export': 'export_notes', 'import': 'import_notes'}
+
+write_commands = frozenset(['create', 'update', 'delete', 'import'])
+
+stream_methods = {'search': 'search_stream'}
+
+stream_chunk_size = 1000
+
+
+class UnknownCommand(ValueError):
+    pass
+
+
+def execute(api, command, argument):
+    if command not in formatters:
+        raise UnknownCommand('unknown command {0!r}'.format(command.upper()))
+
+    if command in bare_commands:
+        result = getattr(api, bare_commands[command])()
+    else:
+        result = getattr(api, api_methods.get(command, command))(argument)
+    return None if formatters[command] is None else formatters[command](result)
+
+
+def execute_stream(api, command, argument):
+    if command not in stream_methods:
+        line = execute(api, command, argument)
+        return None if line is None else [line]
+    return _id_chunks(getattr(api, stream_methods[command])(argument))
+
+
+def read_commands(lines, report):
+    lines = iter(lines)
+    for line in lines:
+        command = line.strip().lower()
+        if not command:
+            continue
+        if command in bare_commands:
+            yield command, None
+            continue
+        argument = next(lines, None)
+        if argument is None:
+            report('{0} is missing its argument line'.format(command.upper()))
+            return
+        yield command, argument.rstrip()
+
+
+def _id_chunks(ids):
+    ids = iter(ids)
+    separator = ''
+    chunk = list(islice(ids, stream_chunk_size))
+    while chunk:
+        yield separator + _ids(chunk)
+        separator = ', '
+        chunk = list(islice(ids, stream_chunk_size))
+
+
+def _ids(ids):
+    return ', '.join(str(id) for id in ids)
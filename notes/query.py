@@ -0,0 +1,64 @@
+from collections import namedtuple
+from threading import Lock
+
+from .base import BaseNotesStore, Page
+from .cache import LRUCache
+
+
+page_options = frozenset(['after', 'limit', 'offset', 'sort'])
+
+
+class Query(namedtuple('Query', 'terms tags page keys')):
+    __slots__ = ()
+
+
+
+class QueryCache(object):
+    def __init__(self, size=1024):
+        self.queries = LRUCache(size)
+        self._lock = Lock()
+
+
+    def parse(self, criteria):
+        with self._lock:
+            query = self.queries.get(criteria)
+        if query is None:
+            query = parse_query(criteria)
+            with self._lock:
+                self.queries.put(criteria, query)
+        return query
+
+
+
+def parse_query(criteria):
+    if isinstance(criteria, bytes):
+        criteria = criteria.decode('utf-8')
+    terms = set()
+    tags = set()
+    options = {}
+    for criterion in criteria.split():
+        name, _, value = criterion.lower().partition(':')
+        if criterion.startswith('tag:'):
+            tags.add(criterion[4:].lower())
+        elif name in page_options and value:
+            options[name] = value
+        else:
+            terms.add(criterion.lower())
+
+    terms = tuple(sorted(terms))
+    tags = tuple(sorted(tags))
+    return Query(terms, tags, _page(options), BaseNotesStore.query_keys(terms, tags))
+
+
+def _page(options):
+    sort = options.get('sort', 'id')
+    if sort not in ('id', 'recent'):
+        raise ValueError('unknown sort {0!r}, expected id or recent'.format(sort))
+    after = int(options['after']) if 'after' in options else None
+    if after is not None and sort != 'id':
+        raise ValueError('after: only works with sort:id; use offset: to page through sort:recent')
+    offset = int(options.get('offset', 0))
+    limit = int(options['limit']) if 'limit' in options else None
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError('limit: and offset: must not be negative')
+    return Page(sort, after, offset, limit)
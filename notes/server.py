@@ -0,0 +1,200 @@
+import logging
+import os
+from threading import Event, Thread
+
+try:
+    import socketserver
+    from queue import Full, Queue
+except ImportError:
+    import SocketServer as socketserver
+    from Queue import Full, Queue
+
+from .api import NotesAPI
+from .protocol import execute, read_commands, write_commands
+from .store import notes_store_session
+
+
+log = logging.getLogger('notes.server')
+
+
+class NotesServer(object):
+    def __init__(self, address, path='notes.db', readers=8, pipeline_depth=64, profile=None, probe_workers=None):
+        with notes_store_session(path) as store:
+            store.use_wal()
+
+        self.reader_api = NotesAPI(path, pool_size=readers, profile=profile, probe_workers=probe_workers)
+        self.writer_api = NotesAPI(path, profile=profile, probe_workers=probe_workers)
+        self.read_pool = _Workers(readers)
+        self.write_pool = _Workers(1)
+        self.pipeline_depth = pipeline_depth
+
+        server_class = _UnixServer if isinstance(address, str) else _TCPServer
+        self.server = server_class(address, _ConnectionHandler)
+        self.server.notes = self
+
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+    def close(self):
+        self.server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        self.write_pool.close()
+        self.read_pool.close()
+        self.writer_api.close()
+        self.reader_api.close()
+
+
+    def submit(self, command, argument):
+        if command in write_commands:
+            return self.write_pool.submit(execute, self.writer_api, command, argument)
+        return self.read_pool.submit(execute, self.reader_api, command, argument)
+
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    wbufsize = 64 * 1024
+    put_timeout = 0.1
+
+    def handle(self):
+        notes = self.server.notes
+        responses = Queue(maxsize=notes.pipeline_depth)
+        stopped = Event()
+        reader = Thread(target=self._read_requests, args=(notes, responses, stopped))
+        reader.daemon = True
+        reader.start()
+
+        try:
+            while True:
+                pending = responses.get()
+                if pending is None:
+                    break
+                try:
+                    line = pending.get()
+                except Exception as e:
+                    line = 'ERROR {0}'.format(e)
+                if line is not None:
+                    self.wfile.write(_encode(line + '\n'))
+                if responses.empty():
+                    self.wfile.flush()
+        finally:
+            stopped.set()
+        reader.join()
+
+
+    def _read_requests(self, notes, responses, stopped):
+        last_write = None
+        try:
+            lines = (line if isinstance(line, str) else line.decode('utf-8') for line in iter(self.rfile.readline, b''))
+            for command, argument in read_commands(lines, log.warning):
+                if command not in write_commands and last_write is not None:
+                    last_write.wait()
+                if stopped.is_set():
+                    break
+                pending = notes.submit(command, argument)
+                if command in write_commands:
+                    last_write = pending
+                if not self._put(responses, pending, stopped):
+                    break
+        finally:
+            self._put(responses, None, stopped)
+
+
+    def _put(self, responses, item, stopped):
+        while not stopped.is_set():
+            try:
+                responses.put(item, timeout=self.put_timeout)
+                return True
+            except Full:
+                pass
+        return False
+
+
+
+class _Pending(object):
+    def __init__(self):
+        self._done = Event()
+        self._value = None
+        self._error = None
+
+
+    def get(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+    def wait(self):
+        self._done.wait()
+
+
+    def finish(self, value=None, error=None):
+        self._value = value
+        self._error = error
+        self._done.set()
+
+
+
+class _Workers(object):
+    def __init__(self, count):
+        self._tasks = Queue()
+        self._threads = [Thread(target=self._work) for n in range(count)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+
+    def submit(self, function, *args):
+        pending = _Pending()
+        self._tasks.put((pending, function, args))
+        return pending
+
+
+    def close(self):
+        for thread in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            pending, function, args = task
+            try:
+                pending.finish(function(*args))
+            except Exception as e:
+                pending.finish(error=e)
+
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+
+def _encode(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
@@ -0,0 +1,223 @@
+import os
+from multiprocessing import Pipe, Process, cpu_count
+from types import GeneratorType
+
+from .base import ALL_BY_ID, BaseNotesStore, Page
+from .store import NotesStore
+
+
+class ShardedNotesStore(BaseNotesStore):
+    default_path = 'notes.db'
+    default_shards = cpu_count()
+    poolable = False
+
+    def __init__(self, path='notes.db', batch_size=1, shards=None, profile=None, probe_workers=0):
+        super(ShardedNotesStore, self).__init__(path, batch_size)
+        existing = count_shards(path)
+        if shards is None:
+            shards = existing or self.default_shards
+        elif existing and existing != shards:
+            raise ValueError('{0} has {1} shards, not {2}; rebalance it first'.format(path, existing, shards))
+
+        self._workers = []
+        for n in range(shards):
+            connection, worker_connection = Pipe()
+            process = Process(target=_serve_shard, args=(shard_path(path, n), worker_connection, profile,
+                                                           probe_workers))
+            process.daemon = True
+            process.start()
+            worker_connection.close()
+            self._workers.append((process, connection))
+
+
+    @property
+    def shards(self):
+        return len(self._workers)
+
+
+    def close(self):
+        for process, connection in self._workers:
+            connection.send(None)
+        for process, connection in self._workers:
+            process.join()
+            connection.close()
+        self._workers = []
+
+
+    def flush(self):
+        self._call_all('flush')
+
+
+    def changes_since(self, revision):
+        return [id for ids in self._call_all('changes_since', revision) for id in ids]
+
+
+    def dump(self):
+        return (note_attrs for notes in self._call_all('dump') for note_attrs in notes)
+
+
+    def fetch_notes(self, ids):
+        notes = {}
+        for shard_notes in self._call_by_shard('fetch_notes', ids):
+            notes.update(shard_notes)
+        return notes
+
+
+    def last_revision(self):
+        return max(self._call_all('last_revision'))
+
+
+    def notes(self):
+        return (note for notes in self._call_all('notes') for note in notes)
+
+
+    def tags(self):
+        values = sorted(set(tag['value'] for tags in self._call_all('tags') for tag in tags))
+        return ({'id': n + 1, 'value': value} for n, value in enumerate(values))
+
+
+    def update_note(self, note_attrs):
+        self._call(self._shard_of(note_attrs['id']), 'update_note', note_attrs)
+
+
+    def delete_note(self, id):
+        self._call(self._shard_of(id), 'delete_note', id)
+
+
+    def iter_matches(self, terms=None, tags=None, after=None, keys=None):
+        while True:
+            ids = self.match_notes(terms, tags, Page('id', after, 0, self.stream_chunk_size), keys)
+            for id in ids:
+                yield id
+            if len(ids) < self.stream_chunk_size:
+                return
+            after = ids[-1]
+
+
+    def match_many(self, queries):
+        with self.stats.timer('store.match_many'):
+            pages = [query[2] if len(query) > 2 else ALL_BY_ID for query in queries]
+            queries = [(query[0], query[1], _shard_page(page)) + tuple(query[3:]) for query, page in zip(queries, pages)]
+            results = [[] for query in queries]
+            for shard_results in self._call_all('match_many', queries):
+                for ids, shard_ids in zip(results, shard_results):
+                    ids.extend(shard_ids)
+            return [self._page(ids, page) for ids, page in zip(results, pages)]
+
+
+    def match_notes(self, terms=None, tags=None, page=ALL_BY_ID, keys=None):
+        with self.stats.search(terms, tags):
+            ids = self._call_all('match_notes', terms, tags, _shard_page(page), keys)
+            return self._page([id for shard_ids in ids for id in shard_ids], page)
+
+
+    def _call(self, shard, name, *args):
+        connection = self._workers[shard][1]
+        connection.send((name, args, self.batch_size))
+        return self._receive(connection)
+
+
+    def _call_all(self, name, *args):
+        for process, connection in self._workers:
+            connection.send((name, args, self.batch_size))
+        return [self._receive(connection) for process, connection in self._workers]
+
+
+    def _call_by_shard(self, name, ids):
+        shard_ids = [[] for worker in self._workers]
+        for id in ids:
+            shard_ids[self._shard_of(id)].append(id)
+        for (process, connection), ids in zip(self._workers, shard_ids):
+            connection.send((name, (ids,), self.batch_size))
+        return [self._receive(connection) for process, connection in self._workers]
+
+
+    def _is_empty(self):
+        return all(self._call_all('_is_empty'))
+
+
+    def _estimate(self, field, key, is_prefix):
+        return sum(self._call_all('_estimate', field, key, is_prefix))
+
+
+    def _receive(self, connection):
+        error, result = connection.recv()
+        if error is not None:
+            raise error
+        return result
+
+
+    def _revisions(self, ids):
+        revisions = {}
+        for shard_revisions in self._call_by_shard('_revisions', ids):
+            revisions.update(shard_revisions)
+        return revisions
+
+
+    def _set_revision(self, id, revision):
+        self._call(self._shard_of(id), '_set_revision', id, revision)
+
+
+    def _shard_of(self, id):
+        return int(id) % len(self._workers)
+
+
+
+def count_shards(path):
+    n = 0
+    while os.path.isfile(shard_path(path, n)):
+        n += 1
+    return n
+
+
+def rebalance(path, shards, batch_size=10000):
+    old_paths = [shard_path(path, n) for n in range(count_shards(path))]
+    if not old_paths and os.path.isfile(path):
+        old_paths = [path]
+    new_paths = [shard_path(path, n, suffix='.rebalance') for n in range(shards)]
+
+    sources = [NotesStore(old_path) for old_path in old_paths]
+    try:
+        for n, new_path in enumerate(new_paths):
+            target = NotesStore(new_path, batch_size)
+            try:
+                target.bulk_load(note_attrs for source in sources for note_attrs in source.dump()
+                                 if int(note_attrs['id']) % shards == n)
+            finally:
+                target.close()
+    finally:
+        for source in sources:
+            source.close()
+
+    for old_path in old_paths:
+        if old_path != path:
+            os.remove(old_path)
+    for n, new_path in enumerate(new_paths):
+        os.rename(new_path, shard_path(path, n))
+
+
+def shard_path(path, n, suffix=''):
+    root, extension = os.path.splitext(path)
+    return '{0}.shard{1}{2}{3}'.format(root, n, extension, suffix)
+
+
+def _shard_page(page):
+    return page._replace(offset=0, limit=None if page.limit is None else page.offset + page.limit)
+
+
+def _serve_shard(path, connection, profile=None, probe_workers=0):
+    store = NotesStore(path, profile=profile, probe_workers=probe_workers)
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                break
+            name, args, store.batch_size = request
+            try:
+                result = getattr(store, name)(*args)
+                connection.send((None, list(result) if isinstance(result, GeneratorType) else result))
+            except Exception as e:
+                connection.send((e, None))
+    finally:
+        store.close()
+        connection.close()
@@ -0,0 +1,115 @@
+import logging
+from collections import defaultdict
+from threading import Lock
+from timeit import default_timer
+
+
+slow_search_log = logging.getLogger('notes.slow')
+
+
+class Stats(object):
+    enabled = True
+
+    def __init__(self, slow_search_ms=None):
+        self.slow_search_ms = slow_search_ms
+        self.counts = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self._lock = Lock()
+
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.counts[name] += 1
+            self.seconds[name] += seconds
+
+
+    def report(self):
+        with self._lock:
+            names = sorted(self.counts)
+            lines = ['{0:24} {1:>10} {2:>12} {3:>10}'.format('phase', 'count', 'total ms', 'mean ms')]
+            for name in names:
+                lines.append('{0:24} {1:10d} {2:12.3f} {3:10.3f}'.format(
+                    name, self.counts[name], self.seconds[name] * 1000,
+                    self.seconds[name] * 1000 / self.counts[name]))
+        return lines
+
+
+    def search(self, terms, tags):
+        return _SearchTimer(self, terms, tags)
+
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+
+
+class NullStats(object):
+    enabled = False
+
+    def record(self, name, seconds):
+        pass
+
+
+    def report(self):
+        return []
+
+
+    def search(self, terms, tags):
+        return _null_timer
+
+
+    def timer(self, name):
+        return _null_timer
+
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def append(self, item):
+        pass
+
+
+
+class _Timer(object):
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.started = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        self.stats.record(self.name, default_timer() - self.started)
+
+
+
+class _SearchTimer(_Timer):
+    def __init__(self, stats, terms, tags):
+        super(_SearchTimer, self).__init__(stats, 'store.match')
+        self.terms = terms
+        self.tags = tags
+        self.trace = []
+
+    def __enter__(self):
+        super(_SearchTimer, self).__enter__()
+        return self.trace
+
+    def __exit__(self, *args):
+        elapsed_ms = (default_timer() - self.started) * 1000
+        self.stats.record(self.name, elapsed_ms / 1000)
+        if self.stats.slow_search_ms is not None and elapsed_ms >= self.stats.slow_search_ms:
+            slow_search_log.warning('slow search (%.1f ms) terms=%s tags=%s plan: %s', elapsed_ms,
+                                    ' '.join(self.terms or ()), ' '.join(self.tags or ()),
+                                    '; '.join('{0} {1}{2} ~{3} -> {4} candidates'.format(
+                                        step.field, step.key, '*' if step.is_prefix else '', step.estimate, count)
+                                        for step, count in self.trace))
+
+
+NULL_STATS = NullStats()
+_null_timer = _NullTimer()
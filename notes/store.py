@@ -1,33 +1,181 @@
 import os
+from contextlib import contextmanager
+from functools import partial
+from itertools import groupby, islice
 from sqlite3 import connect
-
-import re
-
-
-class NotesStore:
-    _wild_suffix_pattern = re.compile(r'\*$')
-
-    def __init__(self):
-        if not os.path.isfile('notes.db'):
+from threading import Condition
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+from time import time
+
+from .base import ALL_BY_ID, BaseNotesStore
+from .postings import first_ids
+from .stats import NULL_STATS
+
+
+class NotesStore(BaseNotesStore):
+    default_path = 'notes.db'
+    schema_version = 6
+    estimate_limit = 10000
+    _probe_chunk_size = 500
+    _conditions = {'exact': '{0} = ?', 'prefix': '{0} >= ? AND {0} < ?', 'any': '1'}
+    _estimate_sql = 'SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {condition} LIMIT ?)'
+    _fetch_sql = 'SELECT note_id FROM {table} WHERE {condition}'
+    _first_sql = 'SELECT DISTINCT note_id FROM {table} WHERE {condition} ORDER BY note_id LIMIT ?'
+    _first_after_sql = 'SELECT DISTINCT note_id FROM {table} WHERE {condition} AND note_id > ? ORDER BY note_id LIMIT ?'
+    _stream_sql = 'SELECT DISTINCT note_id FROM {table} WHERE {condition} ORDER BY note_id'
+    _stream_after_sql = 'SELECT DISTINCT note_id FROM {table} WHERE {condition} AND note_id > ? ORDER BY note_id'
+    _probe_sql = 'SELECT DISTINCT note_id FROM {table} WHERE note_id IN ({ids}) AND {condition}'
+    _statements = {}
+    _index_sql = {
+        'deleted_notes_revision': 'CREATE INDEX deleted_notes_revision ON deleted_notes (revision)',
+        'notes_revision': 'CREATE INDEX notes_revision ON notes (revision)',
+        'notes_tags_note_id': 'CREATE UNIQUE INDEX notes_tags_note_id ON notes_tags (note_id, tag_id)',
+        'notes_tags_tag_id': 'CREATE INDEX notes_tags_tag_id ON notes_tags (tag_id, note_id)',
+        'notes_terms_note_id': 'CREATE INDEX notes_terms_note_id ON notes_terms (note_id, term)',
+        'tags_lower_value': 'CREATE INDEX tags_lower_value ON tags (lower_value)',
+    }
+    bulk_chunk_size = 10000
+    bulk_cache_kb = 256 * 1024
+    cached_statements = 1024
+    parallel_probe_min = 5000
+    profiles = {
+        'safe': [('synchronous', 'FULL')],
+        'balanced': [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('cache_size', -64 * 1024),
+                     ('mmap_size', 256 * 1024 * 1024)],
+        'ingest': [('journal_mode', 'WAL'), ('synchronous', 'OFF'), ('cache_size', -256 * 1024),
+                   ('mmap_size', 1024 * 1024 * 1024), ('temp_store', 'MEMORY')],
+    }
+
+    def __init__(self, path='notes.db', batch_size=1, profile=None, probe_workers=0):
+        super(NotesStore, self).__init__(path, batch_size)
+        if profile is not None and profile not in self.profiles:
+            raise ValueError('unknown storage profile {0!r}, expected one of {1}'.format(
+                profile, ', '.join(sorted(self.profiles))))
+        self.profile = profile
+        self.probe_workers = probe_workers
+        self._pending_writes = 0
+        self._probe_pool = None
+        self._probe_connections = None
+        if not os.path.isfile(path):
             self.initialize_db()
-        self.sql = connect('notes.db')
+        self.sql = self._connect()
+        self._migrate()
 
 
     def initialize_db(self):
-        sql = connect('notes.db')
+        sql = connect(self.path)
         cursor = sql.cursor()
 
         cursor.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, content TEXT)')
-        cursor.execute('CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, value TEXT NOT NULL)')
-        cursor.execute('CREATE TABLE notes_tags (note_id INTEGER NOT NULL, tag_id INTEGER NOT NULL)')
+        self._add_revisions(cursor)
+        self._create_tag_tables(cursor)
+        self._create_term_index(cursor)
+        self._create_vocabulary(cursor)
+        self._create_deleted_notes(cursor)
+        cursor.execute('PRAGMA user_version = {0}'.format(self.schema_version))
         sql.commit()
         sql.close()
 
 
     def close(self):
+        self.flush()
+        if self._probe_pool is not None:
+            self._probe_pool.close()
+            self._probe_pool.join()
+            while not self._probe_connections.empty():
+                self._probe_connections.get().close()
         self.sql.close()
 
 
+    def flush(self):
+        with self.stats.timer('store.commit'):
+            self.sql.commit()
+        self._pending_writes = 0
+
+
+    def bulk_load(self, notes):
+        self.flush()
+        if not self._is_empty():
+            return super(NotesStore, self).bulk_load(notes)
+
+        count = 0
+        with self._transaction() as cursor:
+            cache_size = next(cursor.execute('PRAGMA cache_size'))[0]
+            cursor.execute('PRAGMA cache_size = {0}'.format(-self.bulk_cache_kb))
+            for name in sorted(self._index_sql):
+                cursor.execute('DROP INDEX {0}'.format(name))
+            cursor.execute('CREATE TEMP TABLE bulk_terms (term TEXT NOT NULL, note_id INTEGER NOT NULL)')
+
+            revision = self._next_revision(cursor)
+            for chunk in _chunks(notes, self.bulk_chunk_size):
+                cursor.executemany('INSERT INTO notes (id, content, revision) VALUES (?,?,?)',
+                                   ((note_attrs['id'], note_attrs.get('content') or '',
+                                     note_attrs.get('revision') or revision + count + n)
+                                    for n, note_attrs in enumerate(chunk)))
+                cursor.executemany('INSERT INTO bulk_terms (term, note_id) VALUES (?,?)',
+                                   ((word, note_attrs['id']) for note_attrs in chunk
+                                    for word in self._words(note_attrs.get('content') or '')))
+                links = [(note_attrs['id'], tag) for note_attrs in chunk for tag in set(note_attrs.get('tag') or ())]
+                cursor.executemany('INSERT OR IGNORE INTO tags (value, lower_value) VALUES (?,?)',
+                                   ((tag, tag.lower()) for id, tag in links))
+                cursor.executemany('INSERT INTO notes_tags (note_id, tag_id) SELECT ?, id FROM tags WHERE value = ?',
+                                   links)
+                count += len(chunk)
+
+            cursor.execute('INSERT INTO notes_terms (term, note_id) '
+                           'SELECT term, note_id FROM bulk_terms ORDER BY term, note_id')
+            cursor.execute('INSERT INTO vocabulary (term, notes) SELECT term, COUNT(*) FROM bulk_terms GROUP BY term')
+            cursor.execute('DROP TABLE bulk_terms')
+            for name in sorted(self._index_sql):
+                cursor.execute(self._index_sql[name])
+            cursor.execute('PRAGMA cache_size = {0}'.format(cache_size))
+        return count
+
+
+    def changes_since(self, revision):
+        if self._pending_writes:
+            self.flush()
+        return [row[0] for row in self.sql.execute('SELECT id FROM notes WHERE revision > ? UNION '
+                                                   'SELECT id FROM deleted_notes WHERE revision > ?',
+                                                   (revision, revision))]
+
+
+    def dump(self):
+        tags = groupby(self.sql.execute('SELECT note_id, value FROM notes_tags, tags '
+                                        'WHERE tag_id = tags.id ORDER BY note_id, value'), lambda row: row[0])
+        tags = dict((id, [row[1] for row in rows]) for id, rows in tags)
+        for id, content, revision in self.sql.execute('SELECT id, content, revision FROM notes ORDER BY id'):
+            yield {'id': id, 'content': content, 'tag': tags.get(id, []), 'revision': revision}
+
+
+    def fetch_notes(self, ids):
+        if self._pending_writes:
+            self.flush()
+        notes = {}
+        for chunk in _chunks(ids, self._probe_chunk_size):
+            marks = ','.join('?' * len(chunk))
+            for id, content in self.sql.execute('SELECT id, content FROM notes WHERE id IN ({0})'.format(marks), chunk):
+                notes[id] = {'id': id, 'content': content or '', 'tag': []}
+            for id, value in self.sql.execute('SELECT note_id, value FROM notes_tags, tags '
+                                              'WHERE tag_id = tags.id AND note_id IN ({0})'.format(marks), chunk):
+                notes[id]['tag'].append(value)
+        return notes
+
+
+    def last_revision(self):
+        if self._pending_writes:
+            self.flush()
+        return self._last_revision(self.sql.cursor())
+
+
+    def use_wal(self):
+        self.sql.execute('PRAGMA journal_mode = WAL')
+
+
     def notes(self):
         cursor = self.sql.cursor()
         cursor.execute('SELECT * FROM notes')
@@ -41,101 +189,465 @@ class NotesStore:
 
 
     def update_note(self, note_attrs):
+        self._check_note(note_attrs)
         id = note_attrs['id']
         content = note_attrs['content'] if 'content' in note_attrs else None
 
         cursor = self.sql.cursor()
-        cursor.execute('SELECT id FROM notes WHERE id = ?', (id,))
-        if not any(cursor):
+        cursor.execute('SELECT content FROM notes WHERE id = ?', (id,))
+        row = cursor.fetchone()
+        changed = row is None
+        if row is None:
             cursor.execute('INSERT INTO notes (id, content) VALUES (?,?)', (id, '' if content is None else content))
-        elif content is not None:
+            if content is not None:
+                self._index_content(cursor, id, content)
+        elif content is not None and content != row[0]:
             cursor.execute('UPDATE notes SET content = ? WHERE id = ?', (content, id))
+            self._index_content(cursor, id, content, row[0] or '')
+            changed = True
 
         if 'tag' in note_attrs:
-            self._clean_up_tags(cursor, id)
-            for tag in note_attrs['tag']:
-                cursor.execute('INSERT INTO tags (value) VALUES (?)', (tag,))
-                cursor.execute('INSERT INTO notes_tags (note_id, tag_id) VALUES (?,?)',
-                               (id, cursor.lastrowid))
+            changed = self._update_tags(cursor, id, note_attrs['tag'], row is not None) or changed
 
-        self.sql.commit()
+        if changed:
+            cursor.execute('UPDATE notes SET revision = ? WHERE id = ?', (self._next_revision(cursor), id))
+        self._wrote()
 
 
     def delete_note(self, id):
         cursor = self.sql.cursor()
         self._clean_up_tags(cursor, id)
+        words = [row[0] for row in cursor.execute('SELECT term FROM notes_terms WHERE note_id = ?', (id,))]
+        self._count_terms(cursor, (), words)
+        cursor.execute('DELETE FROM notes_terms WHERE note_id = ?', (id,))
         cursor.execute('DELETE FROM notes WHERE id = ?', (id,))
-        self.sql.commit()
+        if cursor.rowcount:
+            cursor.execute('INSERT OR REPLACE INTO deleted_notes (id, revision) VALUES (?,?)',
+                           (id, self._next_revision(cursor)))
+        self._wrote()
+
+
+    def match_many(self, queries):
+        if self._pending_writes:
+            self.flush()
+        return super(NotesStore, self).match_many(queries)
+
 
+    def iter_matches(self, terms=None, tags=None, after=None, keys=None):
+        if self._pending_writes:
+            self.flush()
+        return super(NotesStore, self).iter_matches(terms, tags, after, keys)
 
-    def match_notes(self, terms=None, tags=None):
-        term_match_ids = None
-        tag_match_ids = None
 
-        if terms:
-            term_match_ids = self._notes_matching_all_terms(terms)
+    def match_notes(self, terms=None, tags=None, page=ALL_BY_ID, keys=None):
+        if self._pending_writes:
+            self.flush()
+        return super(NotesStore, self).match_notes(terms, tags, page, keys)
 
-        if tags:
-            tag_match_ids = self._notes_matching_all_tags(tags)
 
-        if term_match_ids is None:
-            term_match_ids = tag_match_ids
-        if tag_match_ids is None:
-            tag_match_ids = term_match_ids
-        return list(term_match_ids.intersection(tag_match_ids))
+    def _add_revisions(self, cursor):
+        cursor.execute('ALTER TABLE notes ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+        cursor.execute(self._index_sql['notes_revision'])
 
 
     def _clean_up_tags(self, cursor, id):
-        cursor.execute('DELETE FROM tags '
-                       'WHERE id IN (SELECT tag_id FROM notes_tags WHERE note_id = ?) '
-                       'AND (SELECT COUNT(*) FROM notes_tags WHERE tag_id = id) = 1', (id,))
-        cursor.execute('DELETE FROM notes_tags WHERE note_id = ?', (id,))
+        with self.stats.timer('store.tag_cleanup'):
+            cursor.execute('DELETE FROM tags '
+                           'WHERE id IN (SELECT tag_id FROM notes_tags WHERE note_id = ?) '
+                           'AND (SELECT COUNT(*) FROM notes_tags WHERE tag_id = id) = 1', (id,))
+            cursor.execute('DELETE FROM notes_tags WHERE note_id = ?', (id,))
+
+
+    def _connect(self):
+        sql = connect(self.path, check_same_thread=False, cached_statements=self.cached_statements)
+        for name, value in self.profiles.get(self.profile, ()):
+            sql.execute('PRAGMA {0} = {1}'.format(name, value))
+        return sql
+
+
+    def _count_terms(self, cursor, added, removed):
+        cursor.executemany('INSERT OR IGNORE INTO vocabulary (term, notes) VALUES (?, 0)', ((word,) for word in added))
+        cursor.executemany('UPDATE vocabulary SET notes = notes + 1 WHERE term = ?', ((word,) for word in added))
+        cursor.executemany('UPDATE vocabulary SET notes = notes - 1 WHERE term = ?', ((word,) for word in removed))
+        cursor.executemany('DELETE FROM vocabulary WHERE term = ? AND notes <= 0', ((word,) for word in removed))
+
+
+    def _create_tag_tables(self, cursor):
+        cursor.execute('CREATE TABLE tags (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE, '
+                       'lower_value TEXT NOT NULL)')
+        cursor.execute(self._index_sql['tags_lower_value'])
+        cursor.execute('CREATE TABLE notes_tags (note_id INTEGER NOT NULL, tag_id INTEGER NOT NULL)')
+        cursor.execute(self._index_sql['notes_tags_note_id'])
+        cursor.execute(self._index_sql['notes_tags_tag_id'])
+
+
+    def _create_term_index(self, cursor):
+        cursor.execute('CREATE TABLE notes_terms (term TEXT NOT NULL, note_id INTEGER NOT NULL, '
+                       'PRIMARY KEY (term, note_id)) WITHOUT ROWID')
+        cursor.execute(self._index_sql['notes_terms_note_id'])
+
+
+    def _create_deleted_notes(self, cursor):
+        cursor.execute('CREATE TABLE deleted_notes (id INTEGER PRIMARY KEY, revision INTEGER NOT NULL)')
+        cursor.execute(self._index_sql['deleted_notes_revision'])
 
 
-    def _make_likes(self, count, field, operator):
-        clause = 'LOWER({0}) LIKE ?'.format(field)
-        return ' {0} '.format(operator).join([clause for n in range(0, count)])
+    def _create_vocabulary(self, cursor):
+        cursor.execute('CREATE TABLE vocabulary (term TEXT PRIMARY KEY, notes INTEGER NOT NULL) WITHOUT ROWID')
+        cursor.execute('INSERT INTO vocabulary (term, notes) SELECT term, COUNT(*) FROM notes_terms GROUP BY term')
 
 
-    def _notes_matching_all_terms(self, terms):
-        wildcards = self._terms_to_sql_wildcards(terms)
-        query = 'SELECT id, content FROM notes WHERE {0}'.format(self._make_likes(len(wildcards), 'content', 'AND'))
-        rows = list(self.sql.cursor().execute(query, wildcards))
+    def _first_ids_by_term(self, terms, after, count):
+        if after is None:
+            statement, params = self._statement(self._first_sql, 'term', 'exact'), [count]
+        else:
+            statement, params = self._statement(self._first_after_sql, 'term', 'exact'), [after, count]
+        return first_ids([[row[0] for row in self.sql.execute(statement, [term] + params)] for term in terms], count)
 
-        progs = [re.compile(r'{0}( |$)'.format(self._wild_suffix_pattern.sub(r'\w*', term)), re.IGNORECASE)
-                 for term in terms]
-        return set(row[0] for row in rows if all(prog.search(row[1]) for prog in progs))
 
+    def _index_content(self, cursor, id, content, old_content=''):
+        with self.stats.timer('store.index_content'):
+            words = self._words(content)
+            old_words = self._words(old_content)
+            cursor.executemany('DELETE FROM notes_terms WHERE term = ? AND note_id = ?',
+                               ((word, id) for word in old_words - words))
+            cursor.executemany('INSERT INTO notes_terms (term, note_id) VALUES (?,?)',
+                               ((word, id) for word in words - old_words))
+            self._count_terms(cursor, words - old_words, old_words - words)
 
-    def _notes_matching_all_tags(self, tags):
+
+    def _estimate(self, field, key, is_prefix):
+        if field == 'term' and not is_prefix:
+            return next(self.sql.execute('SELECT IFNULL(SUM(notes), 0) FROM vocabulary WHERE term = ?', (key,)))[0]
+        if field == 'term':
+            expansion = self._expand(key)
+            estimate = sum(notes for term, notes in expansion)
+            return estimate if len(expansion) <= self.max_prefix_expansion else max(estimate, self.estimate_limit)
+
+        kind, params = self._step_params(key, is_prefix)
+        statement = self._statement(self._estimate_sql, field, kind)
+        return next(self.sql.execute(statement, params + [self.estimate_limit]))[0]
+
+
+    def _migrate(self):
+        version = next(self.sql.execute('PRAGMA user_version'))[0]
+        if version >= self.schema_version:
+            return
+
+        with self._transaction() as cursor:
+            for migration in self._migrations[version:]:
+                migration(self, cursor)
+            cursor.execute('PRAGMA user_version = {0}'.format(self.schema_version))
+
+
+    def _migrate_to_term_index(self, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'notes_terms'")
+        if not any(cursor):
+            self._create_term_index(cursor)
+            for id, content in list(cursor.execute('SELECT id, content FROM notes')):
+                cursor.executemany('INSERT INTO notes_terms (term, note_id) VALUES (?,?)',
+                                   ((word, id) for word in self._words(content or '')))
+
+
+    def _migrate_to_normalized_tags(self, cursor):
+        cursor.execute('ALTER TABLE tags RENAME TO legacy_tags')
+        cursor.execute('ALTER TABLE notes_tags RENAME TO legacy_notes_tags')
+        self._create_tag_tables(cursor)
+        values = [row[0] for row in cursor.execute('SELECT value FROM legacy_tags ORDER BY id')]
+        cursor.executemany('INSERT OR IGNORE INTO tags (value, lower_value) VALUES (?,?)',
+                           ((value, value.lower()) for value in values))
+        cursor.execute('INSERT OR IGNORE INTO notes_tags (note_id, tag_id) '
+                       'SELECT legacy_notes_tags.note_id, tags.id FROM legacy_notes_tags, legacy_tags, tags '
+                       'WHERE legacy_notes_tags.tag_id = legacy_tags.id AND legacy_tags.value = tags.value')
+        cursor.execute('DROP TABLE legacy_notes_tags')
+        cursor.execute('DROP TABLE legacy_tags')
+
+
+    def _migrate_to_revisions(self, cursor):
+        self._add_revisions(cursor)
+
+    def _migrate_to_vocabulary(self, cursor):
+        self._create_vocabulary(cursor)
+
+    def _migrate_to_change_feed(self, cursor):
+        self._create_deleted_notes(cursor)
+
+
+    def _migrate_to_lower_tag_values(self, cursor):
+        if any(row[1] == 'lower_value' for row in cursor.execute('PRAGMA table_info(tags)')):
+            return
+        cursor.execute('DROP INDEX IF EXISTS tags_lower_value')
+        cursor.execute("ALTER TABLE tags ADD COLUMN lower_value TEXT NOT NULL DEFAULT ''")
+        cursor.executemany('UPDATE tags SET lower_value = ? WHERE id = ?',
+                           [(value.lower(), id) for id, value in cursor.execute('SELECT id, value FROM tags')])
+        cursor.execute(self._index_sql['tags_lower_value'])
+
+    _migrations = [_migrate_to_term_index, _migrate_to_normalized_tags, _migrate_to_revisions, _migrate_to_vocabulary,
+                   _migrate_to_change_feed, _migrate_to_lower_tag_values]
+
+
+    def _matching_chunks(self, step, after):
+        kind, params = self._step_params(step.key, step.is_prefix)
+        if after is None:
+            cursor = self.sql.execute(self._statement(self._stream_sql, step.field, kind), params)
+        else:
+            cursor = self.sql.execute(self._statement(self._stream_after_sql, step.field, kind), params + [after])
+        rows = cursor.fetchmany(self.stream_chunk_size)
+        while rows:
+            yield [row[0] for row in rows]
+            rows = cursor.fetchmany(self.stream_chunk_size)
+
+
+    def _matching_ids(self, step, candidates):
+        kind, params = self._step_params(step.key, step.is_prefix)
+        cursor = self.sql.cursor()
+        if candidates is None or len(candidates) > step.estimate:
+            ids = set(row[0] for row in cursor.execute(self._statement(self._fetch_sql, step.field, kind), params))
+            return ids if candidates is None else candidates.intersection(ids)
+
+        ids = set()
+        candidates = list(candidates)
+        chunks = [candidates[start:start + self._probe_chunk_size]
+                  for start in range(0, len(candidates), self._probe_chunk_size)]
+        if self.probe_workers > 1 and len(candidates) >= self.parallel_probe_min and not self._pending_writes:
+            with self.stats.timer('store.parallel_probe'):
+                for chunk_ids in self._parallel_probes().map(partial(self._probe, step.field, kind, params), chunks):
+                    ids.update(chunk_ids)
+            return ids
+
+        for chunk in chunks:
+            statement = self._statement(self._probe_sql, step.field, kind, len(chunk))
+            ids.update(row[0] for row in cursor.execute(statement, chunk + params))
+        return ids
+
+
+    def _expand(self, prefix):
+        if not prefix:
+            return list(self.sql.execute('SELECT term, notes FROM vocabulary LIMIT ?', (self.max_prefix_expansion + 1,)))
+        return list(self.sql.execute('SELECT term, notes FROM vocabulary WHERE term >= ? AND term < ? LIMIT ?',
+                                     (prefix, self._prefix_upper_bound(prefix), self.max_prefix_expansion + 1)))
+
+
+    def _first_matching_ids(self, step, candidates, after, count):
+        if candidates is not None and len(candidates) > step.estimate:
+            return super(NotesStore, self)._first_matching_ids(step, candidates, after, count)
+
+        kind, params = self._step_params(step.key, step.is_prefix)
+        if candidates is None and step.field == 'term' and step.is_prefix:
+            expansion = self._expand(step.key)
+            if len(expansion) <= self.max_prefix_expansion:
+                return self._first_ids_by_term([term for term, notes in expansion], after, count)
+        if candidates is None:
+            if after is None:
+                statement, params = self._statement(self._first_sql, step.field, kind), params + [count]
+            else:
+                statement, params = self._statement(self._first_after_sql, step.field, kind), params + [after, count]
+            return [row[0] for row in self.sql.execute(statement, params)]
+
+        ids = []
+        candidates = sorted(id for id in candidates if after is None or id > after)
+        for start in range(0, len(candidates), self._probe_chunk_size):
+            chunk = candidates[start:start + self._probe_chunk_size]
+            statement = self._statement(self._probe_sql, step.field, kind, len(chunk))
+            ids.extend(sorted(row[0] for row in self.sql.execute(statement, chunk + params)))
+            if len(ids) >= count:
+                break
+        return ids[:count]
+
+
+    def _is_empty(self):
+        return not next(self.sql.execute('SELECT COUNT(*) FROM (SELECT 1 FROM notes LIMIT 1)'))[0]
+
+
+    def _last_revision(self, cursor):
+        return next(cursor.execute('SELECT MAX(revision) FROM (SELECT MAX(revision) AS revision FROM notes '
+                                   'UNION ALL SELECT MAX(revision) FROM deleted_notes)'))[0] or 0
+
+
+    def _next_revision(self, cursor):
+        return max(self._last_revision(cursor) + 1, int(time() * 1000000))
+
+
+    def _parallel_probes(self):
+        if self._probe_pool is None:
+            from multiprocessing.pool import ThreadPool
+
+            self._probe_connections = Queue()
+            for n in range(self.probe_workers):
+                self._probe_connections.put(self._connect())
+            self._probe_pool = ThreadPool(self.probe_workers)
+        return self._probe_pool
+
+
+    def _prefix_upper_bound(self, prefix):
+        return prefix[:-1] + u'%c' % (ord(prefix[-1]) + 1)
+
+
+    def _probe(self, field, kind, params, chunk):
+        sql = self._probe_connections.get()
+        try:
+            statement = self._statement(self._probe_sql, field, kind, len(chunk))
+            return [row[0] for row in sql.execute(statement, chunk + params)]
+        finally:
+            self._probe_connections.put(sql)
+
+
+    def _revisions(self, ids):
+        revisions = {}
+        ids = list(ids)
+        for start in range(0, len(ids), self._probe_chunk_size):
+            chunk = ids[start:start + self._probe_chunk_size]
+            revisions.update(self.sql.execute('SELECT id, revision FROM notes WHERE id IN ({0})'.format(
+                ','.join('?' * len(chunk))), chunk))
+        return revisions
+
+
+    def _set_revision(self, id, revision):
+        self.sql.execute('UPDATE notes SET revision = ? WHERE id = ?', (revision, id))
+
+
+    def _statement(self, template, field, kind, size=0):
+        statement = self._statements.get((template, field, kind, size))
+        if statement is None:
+            table, column = ('notes_tags', 'lower_value') if field == 'tag' else ('notes_terms', 'term')
+            condition = self._conditions[kind].format(column)
+            if field == 'tag' and kind != 'any':
+                condition = 'tag_id IN (SELECT id FROM tags WHERE {0})'.format(condition)
+            statement = template.format(table=table, condition=condition, ids=','.join('?' * size))
+            self._statements[template, field, kind, size] = statement
+        return statement
+
+
+    def _step_params(self, key, is_prefix):
+        if not is_prefix:
+            return 'exact', [key]
+        if key:
+            return 'prefix', [key, self._prefix_upper_bound(key)]
+        return 'any', []
+
+
+    @contextmanager
+    def _transaction(self):
+        isolation_level = self.sql.isolation_level
+        self.sql.isolation_level = None
         cursor = self.sql.cursor()
-        wildcards = self._terms_to_sql_wildcards(tags)
-        query_format = 'SELECT notes.id FROM notes, notes_tags, tags ' \
-                       'WHERE notes.id = notes_tags.note_id AND notes_tags.tag_id = tags.id AND {0}'
-        query = query_format.format(self._make_likes(len(wildcards), 'tags.value', 'OR'))
-        note_ids = set(row[0] for row in cursor.execute(query, wildcards))
+        cursor.execute('BEGIN')
+        try:
+            yield cursor
+            cursor.execute('COMMIT')
+        except:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            self.sql.isolation_level = isolation_level
+
+
+    def _update_tags(self, cursor, id, values, existed=True):
+        with self.stats.timer('store.tag_cleanup'):
+            values = set(values)
+            old_values = set()
+            if existed:
+                old_values.update(row[0] for row in cursor.execute(
+                    'SELECT value FROM notes_tags, tags WHERE note_id = ? AND tag_id = tags.id', (id,)))
+
+            removed = old_values - values
+            cursor.executemany('DELETE FROM notes_tags WHERE note_id = ? AND tag_id = (SELECT id FROM tags WHERE value = ?)',
+                               ((id, value) for value in removed))
+            cursor.executemany('DELETE FROM tags WHERE value = ? '
+                               'AND NOT EXISTS (SELECT 1 FROM notes_tags WHERE tag_id = tags.id)',
+                               ((value,) for value in removed))
+
+            added = values - old_values
+            cursor.executemany('INSERT OR IGNORE INTO tags (value, lower_value) VALUES (?,?)',
+                               ((value, value.lower()) for value in added))
+            cursor.executemany('INSERT OR IGNORE INTO notes_tags (note_id, tag_id) SELECT ?, id FROM tags WHERE value = ?',
+                               ((id, value) for value in added))
+            return bool(removed or added)
+
+
+    def _wrote(self):
+        self._pending_writes += 1
+        if self._pending_writes >= self.batch_size:
+            self.flush()
+
+
+
+def _chunks(iterable, size):
+    iterable = iter(iterable)
+    chunk = list(islice(iterable, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterable, size))
+
+
+
+class NotesStorePool:
+    def __init__(self, path='notes.db', size=1, batch_size=1, store_class=NotesStore, stats=NULL_STATS,
+                 store_options=None):
+        self.path = path
+        self.size = size if store_class.poolable else 1
+        self.batch_size = batch_size
+        self.store_class = store_class
+        self.stats = stats
+        self.store_options = store_options or {}
+        self._stores = []
+        self._idle = []
+        self._changed = Condition()
+
+
+    @contextmanager
+    def session(self):
+        store = self._acquire()
+        try:
+            yield store
+        finally:
+            self._release(store)
+
+
+    def flush(self):
+        with self._changed:
+            for store in self._idle:
+                store.flush()
+
 
-        ids_with_tags = []
-        query_format = 'SELECT tags.value FROM notes_tags, tags ' \
-                       'WHERE notes_tags.note_id = {0} AND notes_tags.tag_id = tags.id'
-        for id in note_ids:
-            query = query_format.format(id)
-            note_tags = [row[0] for row in cursor.execute(query)]
-            ids_with_tags.append((id, ' '.join(note_tags)))
+    def close(self):
+        with self._changed:
+            while len(self._idle) < len(self._stores):
+                self._changed.wait()
+            for store in self._stores:
+                store.close()
+            self._stores = []
+            self._idle = []
 
-        progs = [re.compile(r'{0}( |$)'.format(self._wild_suffix_pattern.sub(r'\w*', tag)), re.IGNORECASE)
-                 for tag in tags]
-        return set(tpl[0] for tpl in ids_with_tags if all(prog.search(tpl[1]) for prog in progs))
 
+    def _acquire(self):
+        with self._changed:
+            while not self._idle and len(self._stores) >= self.size:
+                self._changed.wait()
+            if self._idle:
+                store = self._idle.pop()
+            else:
+                store = self.store_class(self.path, **self.store_options)
+                self._stores.append(store)
+            store.batch_size = self.batch_size
+            store.stats = self.stats
+            return store
 
-    def _terms_to_sql_wildcards(self, terms):
-        return ['%{0}%'.format(term.rstrip('*')).lower() for term in terms]
+
+    def _release(self, store):
+        with self._changed:
+            self._idle.append(store)
+            self._changed.notify()
 
 
 
 class notes_store_session:
+    def __init__(self, path='notes.db', batch_size=1):
+        self.path = path
+        self.batch_size = batch_size
+
     def __enter__(self):
-        self.store = NotesStore()
+        self.store = NotesStore(self.path, self.batch_size)
         return self.store
 
     def __exit__(self, *args):
@@ -1,25 +1,187 @@
 #!/usr/bin/env python
-from sys import stdin
+import sys
+from argparse import ArgumentParser
+from sys import argv, stdin
 
-from notes.api import NotesAPI
+from notes.protocol import UnknownCommand, execute_stream, formatters, read_commands
 
 
-def main():
-    api = NotesAPI()
-    _api_call(api)
-    while not stdin.isatty():
-        if not _api_call(api):
-            break
+backends = ['memory', 'sharded', 'sqlite']
 
+profiles = ['balanced', 'ingest', 'safe']
 
-def _api_call(api):
-    command = stdin.readline().rstrip().lower()
-    if command:
-        result = getattr(api, command)(stdin.readline().rstrip())
-        if command == 'search':
-            print(', '.join(str(id) for id in result))
-        return True
+
+class _BufferedOutput:
+    def __init__(self, stream, autoflush=False, size=1000):
+        self.stream = stream
+        self.autoflush = autoflush
+        self.size = size
+        self._pieces = []
+
+    def write_line(self, line):
+        self.write_chunks([line])
+
+    def write_chunks(self, chunks):
+        try:
+            for chunk in chunks:
+                self._pieces.append(chunk)
+                if len(self._pieces) >= self.size:
+                    self._write()
+        finally:
+            self._pieces.append('\n')
+        if self.autoflush or len(self._pieces) >= self.size:
+            self.flush()
+
+    def flush(self):
+        self._write()
+        self.stream.flush()
+
+    def _write(self):
+        if self._pieces:
+            self.stream.write(''.join(self._pieces))
+            self._pieces = []
+
+
+def main(args=()):
+    options = _parse_args(args)
+    if options.connect:
+        _forward(options)
+        return
+    if options.serve:
+        _serve(options)
+        return
+    if options.rebalance:
+        _rebalance(options)
+        return
+
+    interactive = stdin.isatty()
+    output = _BufferedOutput(sys.stdout, autoflush=interactive)
+    if options.slow_search_ms is not None:
+        import logging
+        logging.basicConfig(format='notesapp: %(message)s')
+
+    from notes.api import NotesAPI
+    api = NotesAPI(options.db, backend=options.backend, cache_size=options.cache_size,
+                   stats=options.stats, slow_search_ms=options.slow_search_ms, shards=options.shards,
+                   profile=options.profile, probe_workers=options.probe_workers)
+    try:
+        if options.search_many:
+            _search_many(api, options.search_many, output)
+            return
+        with api.ingest(options.batch_size):
+            for command, argument in _read_commands(stdin, interactive):
+                _api_call(api, command, argument, output)
+    finally:
+        output.flush()
+        api.close()
+        if options.stats:
+            sys.stderr.write('\n'.join(api.stats_report()) + '\n')
+
+
+def _api_call(api, command, argument, output):
+    try:
+        chunks = execute_stream(api, command, argument)
+        if chunks is not None:
+            output.write_chunks(chunks)
+    except UnknownCommand as e:
+        _report(e)
+    except Exception as e:
+        _report('{0} {1!r} failed: {2}'.format(command.upper(), argument, e))
+
+
+def _parse_args(args):
+    parser = ArgumentParser(description='Create, update, delete and search notes from commands on stdin.')
+    parser.add_argument('--backend', choices=backends, default='sqlite',
+                        help='where notes are kept while running (default: %(default)s)')
+    parser.add_argument('--db', help='path of the notes database, or of the snapshot the memory backend '
+                                     'loads at start and saves at exit (default: notes.db for sqlite, '
+                                     'no snapshot for memory)')
+    parser.add_argument('--batch-size', type=int, default=1, metavar='N',
+                        help='commit CREATE/UPDATE/DELETE commands in transactions of N, '
+                             'and before every SEARCH (default: %(default)s)')
+    parser.add_argument('--profile', choices=profiles,
+                        help='SQLite durability/speed trade-off: safe syncs every commit to disk, balanced uses '
+                             'WAL with a larger page cache and memory-mapped reads, ingest also stops syncing '
+                             '(a crash can lose or corrupt recent writes) for bulk loads (default: SQLite defaults)')
+    parser.add_argument('--probe-workers', type=int, metavar='N',
+                        help='check large candidate sets against the remaining search terms on N threads, '
+                             'each with its own read connection (sqlite and sharded backends; default: serial)')
+    parser.add_argument('--cache-size', type=int, default=0, metavar='N',
+                        help='remember the results of up to N distinct searches until a write '
+                             'could change them (default: no cache)')
+    parser.add_argument('--stats', action='store_true',
+                        help='time every command and store phase, and report the totals on stderr at exit')
+    parser.add_argument('--slow-search-ms', type=float, metavar='MS',
+                        help='log every search slower than MS milliseconds, with its plan, on stderr')
+    parser.add_argument('--search-many', metavar='FILE',
+                        help='instead of reading commands, run every search query in FILE (one per line, '
+                             '"-" for stdin) in one pass and print one result line per query')
+    parser.add_argument('--shards', type=int, metavar='N',
+                        help='with --backend sharded, the number of shard files and worker processes for a new '
+                             'database (default: the existing shard count, or one per CPU)')
+    parser.add_argument('--rebalance', action='store_true',
+                        help='instead of reading stdin, redistribute the notes of a sharded database (or of a '
+                             'plain --db file) across --shards shards')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help='instead of reading stdin, serve the same line protocol to many clients on '
+                             'HOST:PORT or unix:PATH (sqlite backend only)')
+    parser.add_argument('--connect', metavar='ADDRESS',
+                        help='instead of opening the database, forward the commands on stdin to a notesapp.py '
+                             '--serve daemon at HOST:PORT or unix:PATH and print its responses')
+    parser.add_argument('--readers', type=int, default=8, metavar='N',
+                        help='concurrent searches when serving (default: %(default)s)')
+    return parser.parse_args(args)
+
+
+def _forward(options):
+    from notes.client import forward, parse_address
+
+    interactive = stdin.isatty()
+    forward(parse_address(options.connect), iter(stdin.readline, '') if interactive else stdin, sys.stdout,
+            autoflush=interactive)
+
+
+def _rebalance(options):
+    from notes.shards import ShardedNotesStore, rebalance
+
+    rebalance(options.db or 'notes.db', options.shards or ShardedNotesStore.default_shards)
+
+
+def _search_many(api, path, output):
+    stream = stdin if path == '-' else open(path)
+    try:
+        queries = [line.strip() for line in stream]
+    finally:
+        if stream is not stdin:
+            stream.close()
+
+    for ids in api.search_many(queries):
+        output.write_line(formatters['search'](ids))
+
+
+def _serve(options):
+    import logging
+    from notes.client import parse_address
+    from notes.server import NotesServer
+
+    logging.basicConfig(format='notesapp: %(message)s', level=logging.INFO)
+    server = NotesServer(parse_address(options.serve), options.db or 'notes.db', readers=options.readers,
+                         profile=options.profile, probe_workers=options.probe_workers)
+    logging.info('serving %s on %s', server.reader_api.stores.path, options.serve)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def _read_commands(stream, interactive):
+    lines = iter(stream.readline, '') if interactive else stream
+    return read_commands(lines, _report)
+
+
+def _report(message):
+    sys.stderr.write('notesapp: {0}\n'.format(message))
 
 
 if __name__ == '__main__':
-    main()
+    main(argv[1:])
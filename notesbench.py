@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+import json
+import os
+import shutil
+import sys
+import tempfile
+from argparse import ArgumentParser
+from itertools import islice
+from sys import argv
+from threading import Thread
+
+from notes.api import NotesAPI
+from notes.bench import Workload, compare, run, summarize, summarize_startup, time_to_first_result
+from notes.protocol import read_commands
+
+
+def main(args=()):
+    options = _parse_args(args)
+    workload = Workload(notes=options.notes, commands=options.commands, vocabulary=options.vocabulary,
+                        zipf=options.zipf, words_per_note=options.words_per_note, tags=options.tags,
+                        tags_per_note=options.tags_per_note, search_ratio=options.search_ratio,
+                        update_ratio=options.update_ratio, delete_ratio=options.delete_ratio,
+                        prefix_ratio=options.prefix_ratio, tag_ratio=options.tag_ratio, seed=options.seed)
+
+    if options.write_commands:
+        with open(options.write_commands, 'w') as stream:
+            workload.write(stream)
+        return
+    if options.startup:
+        _startup(workload, options)
+        return
+
+    directory = tempfile.mkdtemp(prefix='notesbench-')
+    try:
+        path = None if options.backend == 'memory' else os.path.join(directory, 'notes.db')
+        with NotesAPI(path, backend=options.backend, cache_size=options.cache_size) as api:
+            if options.replay:
+                with open(options.replay) as stream:
+                    report = _run(api, read_commands(stream, _report), options)
+            else:
+                report = _run(api, workload, options)
+    finally:
+        shutil.rmtree(directory)
+
+    report['workload'] = None if options.replay else workload.params()
+    report['options'] = {'backend': options.backend, 'batch_size': options.batch_size,
+                         'cache_size': options.cache_size, 'replay': options.replay}
+    sys.stdout.write('\n'.join(summarize(report)) + '\n')
+
+    if options.compare:
+        with open(options.compare) as stream:
+            sys.stdout.write('\n'.join(compare(json.load(stream), report)) + '\n')
+    if options.output:
+        with open(options.output, 'w') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+
+
+def _parse_args(args):
+    parser = ArgumentParser(description='Generate a synthetic notesapp.py command stream, replay it against '
+                                        'NotesAPI and report throughput and latency per command.')
+    workload = parser.add_argument_group('workload')
+    workload.add_argument('--notes', type=int, default=1000, help='notes created up front (default: %(default)s)')
+    workload.add_argument('--commands', type=int, default=10000,
+                          help='mixed commands after the initial notes (default: %(default)s)')
+    workload.add_argument('--vocabulary', type=int, default=5000, help='distinct content words (default: %(default)s)')
+    workload.add_argument('--zipf', type=float, default=1.1,
+                          help='Zipf skew of word and tag frequencies (default: %(default)s)')
+    workload.add_argument('--words-per-note', type=int, default=20, help='(default: %(default)s)')
+    workload.add_argument('--tags', type=int, default=50, help='distinct tag values (default: %(default)s)')
+    workload.add_argument('--tags-per-note', type=int, default=2, help='(default: %(default)s)')
+    workload.add_argument('--search-ratio', type=float, default=0.8, help='(default: %(default)s)')
+    workload.add_argument('--update-ratio', type=float, default=0.1, help='(default: %(default)s)')
+    workload.add_argument('--delete-ratio', type=float, default=0.05,
+                          help='share of mixed commands that delete; the rest create (default: %(default)s)')
+    workload.add_argument('--prefix-ratio', type=float, default=0.2,
+                          help='share of search terms that are prefixes (default: %(default)s)')
+    workload.add_argument('--tag-ratio', type=float, default=0.3,
+                          help='share of search terms that are tags (default: %(default)s)')
+    workload.add_argument('--seed', type=int, default=0, help='(default: %(default)s)')
+
+    parser.add_argument('--write-commands', metavar='FILE',
+                        help='write the generated commands in notesapp.py input format and exit')
+    parser.add_argument('--replay', metavar='FILE', help='run the commands in FILE instead of a generated workload')
+    parser.add_argument('--backend', choices=sorted(NotesAPI.backends), default='sqlite', help='(default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=1, help='(default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=0, help='(default: %(default)s)')
+    parser.add_argument('--startup', type=int, metavar='RUNS',
+                        help='instead of the workload, time RUNS notesapp.py invocations from start to their first '
+                             'SEARCH result, opening the database directly and through a --serve daemon')
+    parser.add_argument('--output', metavar='FILE', help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare against results saved earlier with --output')
+    return parser.parse_args(args)
+
+
+def _run(api, commands, options):
+    with api.ingest(options.batch_size):
+        return run(api, commands)
+
+
+def _startup(workload, options):
+    from notes.server import NotesServer
+
+    notesapp = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'notesapp.py')
+    directory = tempfile.mkdtemp(prefix='notesbench-')
+    try:
+        path = os.path.join(directory, 'notes.db')
+        with NotesAPI(path) as api:
+            with api.ingest(10000):
+                for command, argument in islice(workload, options.notes):
+                    api.create(argument)
+        query = next(argument for command, argument in workload if command == 'search')
+        commands = 'search\n{0}\n'.format(query)
+
+        report = {'startup': {'direct': time_to_first_result([sys.executable, notesapp, '--db', path], commands,
+                                                              options.startup)}}
+        server = NotesServer(os.path.join(directory, 'notes.sock'), path, readers=1)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            report['startup']['daemon'] = time_to_first_result(
+                [sys.executable, notesapp, '--connect', 'unix:' + server.address], commands, options.startup)
+        finally:
+            server.shutdown()
+            thread.join()
+    finally:
+        shutil.rmtree(directory)
+
+    sys.stdout.write('\n'.join(summarize_startup(report)) + '\n')
+    if options.output:
+        with open(options.output, 'w') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+
+
+def _report(message):
+    sys.stderr.write('notesbench: {0}\n'.format(message))
+
+
+if __name__ == '__main__':
+    main(argv[1:])
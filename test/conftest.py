@@ -13,19 +13,20 @@ def clear_db():
 
 @fixture()
 def mock_api(mocker):
-    api_mock = mocker.Mock(**{m: mocker.Mock() for m in ('create', 'update', 'delete', 'search')})
-    mocker.patch('notesapp.NotesAPI', return_value=api_mock)
+    api_mock = mocker.MagicMock(**{m: mocker.Mock() for m in ('create', 'update', 'delete', 'search', 'search_stream')})
+    mocker.patch('notes.api.NotesAPI', return_value=api_mock)
     return api_mock
 
 
 @fixture()
 def mock_stdin(mocker):
-    def perform(inputs):
+    def perform(inputs, interactive=False):
+        lines = ['{0}\n'.format(s) for s in inputs]
         stdin_mock = mocker.patch('notesapp.stdin')
-        stdin_mock.readline = mocker.MagicMock(side_effect=['{0}\n'.format(s) for s in inputs])
-        isatty_calls = len(inputs) / 2
-        stdin_mock.isatty = mocker.MagicMock(side_effect=[(n == isatty_calls - 1) for n in range(0, isatty_calls)])
-    return lambda inputs: perform(inputs)
+        stdin_mock.__iter__.return_value = iter(lines)
+        stdin_mock.readline = mocker.MagicMock(side_effect=lines + [''])
+        stdin_mock.isatty = mocker.MagicMock(return_value=interactive)
+    return perform
 
 
 @fixture()
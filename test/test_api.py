@@ -68,3 +68,88 @@ def test_search_with_combined_content_terms_and_tags_selects_notes_that_satisfy_
 
     assert len(actual) == 1
     assert actual[0] == 222
+
+
+def test_api_keeps_notes_in_the_configured_database_across_instances(tmpdir):
+    path = str(tmpdir.join('elsewhere.db'))
+
+    with NotesAPI(path) as api:
+        api.create('{"id": "5", "content": "persistent"}')
+
+    with NotesAPI(path) as api:
+        assert api.search('persistent') == [5]
+
+
+def test_api_ingest_defers_commits_until_the_batch_is_done(clear_db, notes_cursor):
+    clear_db()
+
+    with NotesAPI() as api:
+        with api.ingest(batch_size=100):
+            api.create('{"id": "1", "content": "bulk"}')
+            api.create('{"id": "2", "content": "bulk"}')
+            assert len(list(notes_cursor().execute('SELECT * FROM notes'))) == 0
+            assert sorted(api.search('bulk')) == [1, 2]
+            api.delete('2')
+        assert [row[0] for row in notes_cursor().execute('SELECT id FROM notes')] == [1]
+
+
+def test_api_can_keep_notes_in_memory_instead_of_sqlite():
+    with NotesAPI(backend='memory') as api:
+        api.create('{"id": "111", "tag": ["dinner"], "content": "Sweet Potato Pie"}')
+        api.create('{"id": "222", "content": "Mash four potatoes together"}')
+
+        assert api.search('potato tag:din*') == [111]
+
+
+def test_search_many_returns_results_in_query_order_and_fills_the_cache(clear_db):
+    clear_db()
+
+    with NotesAPI(cache_size=10) as api:
+        api.create('{"id": "1", "tag": ["dinner"], "content": "Sweet Potato Pie"}')
+        api.create('{"id": "2", "content": "Mash four potatoes together"}')
+
+        assert api.search_many(['potato', 'tag:dinner pot*', 'potatoes', 'potato', 'nothing']) == \
+            [[1], [1], [2], [1], []]
+        assert api.cache.stats()['entries'] == 4
+
+
+def test_search_options_sort_and_page_the_results(clear_db):
+    clear_db()
+
+    with NotesAPI(cache_size=10) as api:
+        for id in (5, 1, 4, 2, 3):
+            api.create('{{"id": "{0}", "content": "potato"}}'.format(id))
+        api.update('{"id": "2", "content": "potato pie"}')
+
+        assert api.search('potato') == [1, 2, 3, 4, 5]
+        assert api.search('potato limit:2') == [1, 2]
+        assert api.search('potato limit:2 after:2') == [3, 4]
+        assert api.search('potato sort:recent offset:1 limit:2') == [3, 4]
+        assert api.search_many(['potato sort:recent limit:1', 'potato limit:1 offset:4']) == [[2], [5]]
+
+        api.update('{"id": "5", "content": "potato salad"}')
+        assert api.search('potato sort:recent limit:1') == [5]
+
+
+def test_search_rejects_malformed_page_options(clear_db):
+    clear_db()
+
+    with NotesAPI() as api:
+        for criteria in ('potato sort:size', 'potato limit:many', 'potato sort:recent after:3', 'potato offset:-1'):
+            try:
+                api.search(criteria)
+                assert False, 'expected ValueError for ' + criteria
+            except ValueError:
+                pass
+
+
+def test_search_stream_yields_the_same_ids_as_search(clear_db):
+    clear_db()
+
+    with NotesAPI(cache_size=10) as api:
+        for id in range(1, 8):
+            api.create('{{"id": "{0}", "content": "potato", "tag": ["{1}"]}}'.format(id, 'pie' if id % 2 else 'mash'))
+
+        for criteria in ('potato', 'pot* tag:pie', 'potato after:3 offset:1', 'potato sort:recent limit:3', 'nothing'):
+            assert list(api.search_stream(criteria)) == api.search(criteria)
+            assert list(api.search_stream(criteria)) == api.search(criteria)
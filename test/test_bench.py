@@ -0,0 +1,73 @@
+import json
+import sys
+from glob import glob
+
+import notesbench
+from notes.api import NotesAPI
+from notes.bench import Workload, run, time_to_first_result
+from notes.protocol import read_commands
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def test_workload_generates_the_same_commands_for_the_same_seed():
+    first = list(Workload(notes=20, commands=200, seed=7))
+    second = list(Workload(notes=20, commands=200, seed=7))
+    other = list(Workload(notes=20, commands=200, seed=8))
+
+    assert first == second
+    assert first != other
+    assert len(first) == 220
+    assert set(command for command, _ in first) == {'create', 'update', 'delete', 'search'}
+
+
+def test_workload_writes_commands_in_notesapp_input_format():
+    stream = StringIO()
+    Workload(notes=5, commands=20, seed=1).write(stream)
+    stream.seek(0)
+
+    commands = list(read_commands(stream, report=None))
+    assert commands == list(Workload(notes=5, commands=20, seed=1))
+    note = json.loads(commands[0][1])
+    assert sorted(note) == ['content', 'id', 'tag']
+
+
+def test_run_reports_latency_percentiles_per_command_type():
+    with NotesAPI(backend='memory') as api:
+        report = run(api, Workload(notes=50, commands=300, seed=3))
+
+    search = report['commands']['search']
+    assert report['commands']['create']['count'] >= 50
+    assert search['p50'] <= search['p95'] <= search['p99']
+    assert report['throughput'] > 0
+    json.dumps(report)
+
+
+def test_run_replays_every_protocol_command_including_bare_and_renamed_ones(tmpdir):
+    path = str(tmpdir.join('notes.jsonl'))
+    commands = [('create', '{"id": "1", "content": "potato"}'), ('stats', None), ('export', path),
+                ('import', path), ('search', 'potato')]
+    with NotesAPI(backend='memory') as api:
+        report = run(api, commands)
+
+    assert sorted(report['commands']) == ['create', 'export', 'import', 'search', 'stats']
+
+
+def test_time_to_first_result_times_each_run_until_its_first_output_line():
+    echo = [sys.executable, '-c', 'import sys; sys.stdout.write(sys.stdin.readline())']
+    report = time_to_first_result(echo, 'search\npotato\n', runs=3)
+
+    assert report['runs'] == 3
+    assert 0 < report['p50'] <= report['p95']
+
+
+def test_notesbench_keeps_every_file_backed_store_in_its_scratch_directory(capsys):
+    before = set(glob('notes*.db'))
+
+    notesbench.main(['--backend', 'sharded', '--notes', '20', '--commands', '50'])
+
+    assert set(glob('notes*.db')) == before
+    assert 'SEARCH' in capsys.readouterr()[0]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+
+from notes.api import NotesAPI
+from notes.bulk import MAGIC, read_notes, write_notes
+
+
+NOTES = [
+    {'id': 1, 'content': u'Sweet Potato Pie', 'tag': [u'dessert', u'Pie'], 'revision': 11},
+    {'id': 2, 'content': u'Crème brûlée', 'tag': [], 'revision': 12},
+    {'id': 2 ** 40, 'content': u'', 'tag': [u'dinner'], 'revision': 0},
+]
+
+
+def test_export_format_round_trips_notes_through_length_prefixed_records(tmpdir):
+    path = str(tmpdir.join('notes.export'))
+
+    assert write_notes(path, NOTES) == 3
+
+    assert open(path, 'rb').read(len(MAGIC)) == MAGIC
+    assert list(read_notes(path)) == NOTES
+
+
+def test_reading_something_other_than_an_export_fails(tmpdir):
+    path = tmpdir.join('notes.txt')
+    path.write('CREATE\n{"id": "1"}\n')
+
+    try:
+        list(read_notes(str(path)))
+        assert False, 'expected ValueError'
+    except ValueError:
+        pass
+
+
+def test_import_bulk_loads_an_empty_database_and_rebuilds_its_indexes(tmpdir):
+    export = str(tmpdir.join('notes.export'))
+    with NotesAPI(str(tmpdir.join('source.db'))) as source:
+        source.create(json.dumps({'id': 1, 'content': 'Sweet Potato Pie', 'tag': ['dinner', 'pie']}))
+        source.create(json.dumps({'id': 2, 'content': 'Mash potatoes', 'tag': ['dinner']}))
+        source.create(json.dumps({'id': 3, 'content': 'Pot roast'}))
+        source.update(json.dumps({'id': 1, 'content': 'Sweet Potato Tart'}))
+        source.export_notes(export)
+
+    with NotesAPI(str(tmpdir.join('copy.db'))) as copy:
+        assert copy.import_notes(export) == 3
+
+        assert copy.search('pot*') == [1, 2, 3]
+        assert copy.search('tag:din* potato') == [1]
+        assert copy.search('pot* sort:recent limit:1') == [1]
+        with copy.stores.session() as store:
+            indexes = set(row[0] for row in store.sql.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+            assert set(store._index_sql) <= indexes
+
+
+def test_import_into_a_database_with_notes_replaces_them_and_clears_the_cache(tmpdir):
+    export = str(tmpdir.join('notes.export'))
+    write_notes(export, [{'id': 1, 'content': 'potato salad', 'tag': ['lunch']}])
+
+    with NotesAPI(str(tmpdir.join('notes.db')), cache_size=10) as api:
+        api.create(json.dumps({'id': 1, 'content': 'Sweet Potato Pie', 'tag': ['dinner']}))
+        api.create(json.dumps({'id': 2, 'content': 'potato soup'}))
+        assert api.search('potato tag:lunch') == []
+
+        assert api.import_notes(export) == 1
+
+        assert api.search('potato tag:lunch') == [1]
+        assert api.search('potato') == [1, 2]
+        assert api.search('tag:dinner') == []
+
+
+def test_import_keeps_exported_revisions_on_every_empty_backend(tmpdir):
+    path = str(tmpdir.join('backup.notes'))
+    write_notes(path, [{'id': 1, 'content': u'potato', 'tag': [], 'revision': 30},
+                       {'id': 2, 'content': u'potato', 'tag': [], 'revision': 10},
+                       {'id': 3, 'content': u'potato', 'tag': [], 'revision': 20}])
+
+    for backend, shards in (('memory', None), ('sharded', 2)):
+        with NotesAPI(str(tmpdir.join(backend + '.db')), backend=backend, shards=shards) as api:
+            assert api.import_notes(path) == 3
+            assert api.search('potato sort:recent') == [1, 3, 2]
+            with api.stores.session() as store:
+                assert sorted(store.changes_since(15)) == [1, 3]
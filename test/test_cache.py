@@ -0,0 +1,63 @@
+from notes.api import NotesAPI
+from notes.cache import LRUCache
+
+
+def test_lru_cache_evicts_the_least_recently_used_entry_and_counts_hits_and_misses():
+    cache = LRUCache(size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_api_cache_answers_repeated_searches_until_a_write_could_change_them(clear_db):
+    clear_db()
+
+    with NotesAPI(cache_size=10) as api:
+        api.create('{"id": "1", "tag": ["dinner"], "content": "Sweet Potato Pie"}')
+        assert api.search('potato tag:dinner') == [1]
+        assert api.search('tag:DINNER  Potato') == [1]
+        assert api.cache.stats()['hits'] == 1
+
+        api.create('{"id": "2", "content": "unrelated"}')
+        assert api.search('potato tag:dinner') == [1]
+        assert api.cache.stats()['hits'] == 2
+
+        api.create('{"id": "3", "tag": ["dinner"], "content": "potato salad"}')
+        assert sorted(api.search('potato tag:dinner')) == [1, 3]
+        assert api.cache.stats()['hits'] == 2
+
+
+def test_api_cache_drops_results_containing_an_updated_or_deleted_note(clear_db):
+    clear_db()
+
+    with NotesAPI(cache_size=10) as api:
+        api.create('{"id": "1", "content": "potato"}')
+        api.create('{"id": "2", "content": "potato"}')
+        assert sorted(api.search('potato')) == [1, 2]
+
+        api.update('{"id": "1", "tag": ["moved"]}')
+        api.delete('2')
+        assert api.search('potato') == [1]
+        assert api.cache.stats()['misses'] == 2
+
+
+def test_api_cache_drops_paged_results_shifted_by_a_change_to_an_earlier_match(clear_db):
+    clear_db()
+
+    with NotesAPI(cache_size=16) as api:
+        for id in range(1, 7):
+            api.create('{{"id": "{0}", "content": "foo"}}'.format(id))
+
+        assert api.search('foo limit:2 offset:1') == [2, 3]
+        api.delete('1')
+        assert api.search('foo limit:2 offset:1') == [3, 4]
+        api.update('{"id": "2", "content": "bar"}')
+        assert api.search('foo limit:2 offset:1') == [4, 5]
+        api.update('{"id": "2", "content": "foo"}')
+        assert api.search('foo limit:2 offset:1') == [3, 4]
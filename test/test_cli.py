@@ -1,9 +1,16 @@
 
+import os
+import subprocess
 import sys
+from threading import Thread
 
 from mock import call
 
 sys.path.append('..')
+import notesapp
+from notes.api import NotesAPI
+from notes.server import NotesServer
+from notes.store import NotesStore
 from notesapp import main
 
 
@@ -38,11 +45,11 @@ def test_cli_accepts_multiple_commands(clear_db, mock_api, mock_stdin):
 def test_cli_search_command_prints_results_to_stdout(mock_api, mock_stdin, capsys):
     expected_term = 'expected_term'
     mock_stdin(['search', expected_term])
-    mock_api.search.return_value = [1, 2]
+    mock_api.search_stream.return_value = [1, 2]
 
     main()
 
-    mock_api.search.assert_called_with(expected_term)
+    mock_api.search_stream.assert_called_with(expected_term)
     actual, _ = capsys.readouterr()
     assert actual == '1, 2\n'
 
@@ -54,3 +61,203 @@ def test_cli_search_produces_empty_line_when_there_are_no_matches(mock_stdin, ca
 
     actual, _ = capsys.readouterr()
     assert actual == '\n'
+
+
+def test_cli_opens_the_database_named_by_the_db_option_and_closes_it_at_the_end(mocker, mock_stdin):
+    api_class = mocker.patch('notes.api.NotesAPI')
+    mock_stdin(['search', 'anything'])
+
+    main(['--db', 'elsewhere.db'])
+
+    api_class.assert_called_with('elsewhere.db', backend='sqlite', cache_size=0, stats=False, slow_search_ms=None,
+                                 shards=None, profile=None, probe_workers=None)
+    api_class.return_value.close.assert_called_with()
+
+
+def test_cli_batch_size_option_runs_commands_in_ingest_mode(mock_api, mock_stdin):
+    mock_stdin(['create', '{"id": "1"}'])
+
+    main(['--batch-size', '500'])
+
+    mock_api.ingest.assert_called_with(500)
+
+
+def test_cli_explain_command_prints_one_line_per_plan_step(mock_api, mock_stdin, capsys):
+    mock_stdin(['explain', 'potato tag:dinner'])
+    mock_api.explain.return_value = ['1. tag dinner (estimated 1 notes)', '2. term potato (estimated 2 notes)']
+
+    main()
+
+    mock_api.explain.assert_called_with('potato tag:dinner')
+    actual, _ = capsys.readouterr()
+    assert actual == '1. tag dinner (estimated 1 notes)\n2. term potato (estimated 2 notes)\n'
+
+
+def test_cli_reports_malformed_commands_and_keeps_going(mock_api, mock_stdin, capsys):
+    mock_api.create.side_effect = [ValueError('No JSON object could be decoded'), None]
+    mock_stdin(['create', 'not json', 'frobnicate', 'whatever', 'create', '{"id": "1"}', 'search'])
+
+    main()
+
+    mock_api.create.assert_called_with('{"id": "1"}')
+    _, errors = capsys.readouterr()
+    assert errors.splitlines() == [
+        "notesapp: CREATE 'not json' failed: No JSON object could be decoded",
+        "notesapp: unknown command 'FROBNICATE'",
+        'notesapp: SEARCH is missing its argument line',
+    ]
+
+
+def test_cli_buffers_search_output_until_the_end_of_piped_input(mock_api, mock_stdin, mocker):
+    stdout = mocker.patch('sys.stdout')
+    mock_stdin(['search', 'one', 'search', 'two'])
+    mock_api.search_stream.side_effect = [[1], [2]]
+
+    main()
+
+    stdout.write.assert_called_once_with('1\n2\n')
+
+
+def test_cli_flushes_each_search_result_when_interactive(mock_api, mock_stdin, mocker):
+    stdout = mocker.patch('sys.stdout')
+    mock_stdin(['search', 'one', 'search', 'two'], interactive=True)
+    mock_api.search_stream.side_effect = [[1], [2]]
+
+    main()
+
+    stdout.write.assert_has_calls([call('1\n'), call('2\n')])
+
+
+def test_cli_stats_command_takes_no_argument_line_and_prints_the_report(mock_api, mock_stdin, capsys):
+    mock_stdin(['stats', 'search', 'potato'])
+    mock_api.stats_report.return_value = ['phase count', 'api.search 1']
+    mock_api.search_stream.return_value = [1]
+
+    main()
+
+    mock_api.search_stream.assert_called_with('potato')
+    actual, _ = capsys.readouterr()
+    assert actual == 'phase count\napi.search 1\n1\n'
+
+
+def test_cli_rebalance_option_redistributes_the_database_instead_of_reading_stdin(mocker, mock_api):
+    rebalance = mocker.patch('notes.shards.rebalance')
+
+    main(['--db', 'elsewhere.db', '--shards', '3', '--rebalance'])
+
+    rebalance.assert_called_with('elsewhere.db', 3)
+    mock_api.search_stream.assert_not_called()
+
+
+def test_cli_search_many_option_prints_one_line_per_query_in_the_file(mock_api, tmpdir, capsys):
+    queries = tmpdir.join('queries.txt')
+    queries.write('potato\ntag:dinner\n')
+    mock_api.search_many.return_value = [[1, 2], []]
+
+    main(['--search-many', str(queries)])
+
+    mock_api.search_many.assert_called_with(['potato', 'tag:dinner'])
+    actual, _ = capsys.readouterr()
+    assert actual == '1, 2\n\n'
+
+
+def test_cli_import_and_export_commands_take_a_file_name(mock_api, mock_stdin):
+    mock_stdin(['export', 'backup.notes', 'IMPORT', 'seed.notes'])
+
+    main()
+
+    mock_api.export_notes.assert_called_with('backup.notes')
+    mock_api.import_notes.assert_called_with('seed.notes')
+
+
+def test_cli_profile_option_selects_the_storage_profile(mocker, mock_stdin):
+    api_class = mocker.patch('notes.api.NotesAPI')
+    mock_stdin([])
+
+    main(['--profile', 'ingest'])
+
+    assert api_class.call_args[1]['profile'] == 'ingest'
+
+
+def test_cli_connect_option_forwards_stdin_to_a_serving_daemon(mock_api, mock_stdin, tmpdir, capsys):
+    server = NotesServer(str(tmpdir.join('notes.sock')), str(tmpdir.join('notes.db')), readers=1)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    mock_stdin(['create', '{"id": "1", "content": "potato"}', 'search', 'potato'])
+    try:
+        main(['--connect', 'unix:' + server.address])
+    finally:
+        server.shutdown()
+        thread.join()
+
+    actual, _ = capsys.readouterr()
+    assert actual == '1\n'
+    mock_api.search_stream.assert_not_called()
+
+
+def test_cli_serve_option_starts_a_server_with_the_storage_options(mocker):
+    server_class = mocker.patch('notes.server.NotesServer', autospec=True)
+    server_class.return_value.reader_api = mocker.Mock()
+    mocker.patch('logging.basicConfig')
+
+    main(['--serve', 'unix:/tmp/notes.sock', '--db', 'elsewhere.db', '--readers', '3', '--profile', 'balanced',
+          '--probe-workers', '2'])
+
+    server_class.assert_called_with('/tmp/notes.sock', 'elsewhere.db', readers=3, profile='balanced',
+                                    probe_workers=2)
+    server_class.return_value.serve_forever.assert_called_with()
+
+
+def test_cli_loads_the_store_modules_only_when_it_opens_a_database():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    imported = subprocess.check_output([sys.executable, '-c', 'import sys, notesapp; '
+                                        'print(sorted(m for m in ("notes.api", "notes.store", "sqlite3") '
+                                        'if m in sys.modules))'], cwd=root)
+
+    assert imported.strip() == b'[]'
+
+
+def test_cli_backend_and_profile_choices_match_the_api():
+    assert notesapp.backends == sorted(NotesAPI.backends)
+    assert notesapp.profiles == sorted(NotesStore.profiles)
+
+
+def test_cli_search_caches_streamed_results_and_reports_their_phases(clear_db, mock_stdin, capsys):
+    clear_db()
+    mock_stdin(['create', '{"id": "1", "content": "potato"}', 'search', 'potato', 'search', 'potato', 'stats'])
+
+    main(['--cache-size', '10', '--stats'])
+
+    actual, _ = capsys.readouterr()
+    lines = actual.splitlines()
+    assert lines[:2] == ['1', '1']
+    phases = [line.split()[0] for line in lines[2:]]
+    assert 'api.search' in phases and 'store.match' in phases and 'store.plan' in phases
+    assert 'cache entries=1 hits=1 misses=1 size=10' in lines
+
+
+def test_cli_logs_slow_streamed_searches_with_their_plan(clear_db, mock_stdin, mocker):
+    clear_db()
+    warning = mocker.patch('notes.stats.slow_search_log.warning')
+    mock_stdin(['create', '{"id": "1", "content": "potato pie"}', 'search', 'potato pie'])
+
+    main(['--slow-search-ms', '0'])
+
+    args = warning.call_args[0]
+    assert args[0].startswith('slow search')
+    assert 'term pie ~1 -> 1 candidates' in args[-1]
+
+
+def test_cli_rejects_a_malformed_note_without_leaving_part_of_it_behind(clear_db, mock_stdin, capsys):
+    clear_db()
+    mock_stdin(['create', '{"id": 5, "content": "hello", "tag": 7}', 'create', '{"id": 6, "content": "bye"}',
+                'search', 'hello', 'search', 'bye'])
+
+    main()
+
+    actual, errors = capsys.readouterr()
+    assert actual.splitlines() == ['', '6']
+    assert errors.splitlines() == [
+        'notesapp: CREATE \'{"id": 5, "content": "hello", "tag": 7}\' failed: note 5: tag must be a list of text',
+    ]
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from notes.api import NotesAPI
+
+
+@pytest.fixture(params=['sqlite', 'memory', 'sharded'])
+def api(request, tmpdir):
+    shards = 2 if request.param == 'sharded' else None
+    api = NotesAPI(str(tmpdir.join('notes.db')), backend=request.param, shards=shards)
+    yield api
+    api.close()
+
+
+def test_subscription_reports_only_the_notes_that_entered_or_left_its_results(api):
+    api.create(json.dumps({'id': 1, 'content': 'potato pie', 'tag': ['dinner']}))
+    api.create(json.dumps({'id': 2, 'content': 'kettle'}))
+    subscription, revision = api.subscribe('pot* tag:dinner')
+
+    api.create(json.dumps({'id': 3, 'content': 'potatoes', 'tag': ['Dinner']}))
+    api.update(json.dumps({'id': 2, 'content': 'potato kettle', 'tag': ['dinner']}))
+    api.update(json.dumps({'id': 1, 'content': 'apple pie'}))
+    later, entered, left = api.changes(subscription)
+    assert later > revision
+    assert (entered, left) == ([2, 3], [1])
+
+    assert api.changes(subscription) == (later, [], [])
+
+    api.delete('3')
+    api.update(json.dumps({'id': 2, 'content': 'potato kettle black'}))
+    assert api.changes(str(subscription))[1:] == ([], [3])
+
+
+def test_subscription_rejects_paged_empty_and_unknown_queries(api):
+    for criteria in ('potato limit:5', 'potato sort:recent', ''):
+        with pytest.raises(ValueError):
+            api.subscribe(criteria)
+
+    subscription, revision = api.subscribe('potato')
+    api.unsubscribe(subscription)
+    with pytest.raises(ValueError):
+        api.changes(subscription)
@@ -0,0 +1,138 @@
+import os
+import pickle
+
+from notes.base import Page
+from notes.memory import MemoryNotesStore
+from notes.postings import PostingList
+
+
+def test_memory_store_matches_exact_words_and_prefixes_without_case_sensitivity():
+    store = MemoryNotesStore()
+    store.update_note({'id': '1', 'content': 'Sweet Potato Pie'})
+    store.update_note({'id': '2', 'content': 'Mash four potatoes together'})
+    store.update_note({'id': '3', 'content': 'Pot: Kettle; Kettle: Pot'})
+
+    assert store.match_notes(['POTATO']) == [1]
+    assert sorted(store.match_notes(['pot*'])) == [1, 2, 3]
+    assert store.match_notes(['pot*', 'kettle']) == [3]
+
+
+def test_memory_store_matches_tags_and_content_together():
+    store = MemoryNotesStore()
+    store.update_note({'id': 1, 'content': 'pot content'})
+    store.update_note({'id': 2, 'tag': ['Pancake', 'dinner'], 'content': 'Potatoes are expected'})
+    store.update_note({'id': 3, 'tag': ['pan'], 'content': 'does not matter'})
+
+    assert store.match_notes(terms=['pot*'], tags=['pan*']) == [2]
+    assert store.match_notes(tags=['pancake', 'DINNER']) == [2]
+    assert store.match_notes(tags=['pan']) == [3]
+
+
+def test_memory_store_update_replaces_only_the_given_attributes_and_delete_forgets_the_note():
+    store = MemoryNotesStore()
+    store.update_note({'id': 42, 'tag': ['foo'], 'content': 'kept'})
+    store.update_note({'id': 42, 'tag': ['bar']})
+
+    assert store.match_notes(['kept'], ['bar']) == [42]
+    assert store.match_notes(tags=['foo']) == []
+
+    store.delete_note('42')
+    assert store.match_notes(['kept']) == []
+    assert list(store.notes()) == []
+    assert list(store.tags()) == []
+
+
+def test_memory_store_saves_a_snapshot_on_close_and_loads_it_on_open(tmpdir):
+    path = str(tmpdir.join('notes.snapshot'))
+    store = MemoryNotesStore(path)
+    store.update_note({'id': 7, 'tag': ['pie'], 'content': 'Sweet Potato Pie'})
+    store.close()
+
+    assert os.path.isfile(path)
+    reopened = MemoryNotesStore(path)
+    assert reopened.match_notes(['potato'], ['pie']) == [7]
+
+
+def test_memory_store_plans_the_rarest_term_first():
+    store = MemoryNotesStore()
+    store.update_note({'id': 1, 'tag': ['dinner'], 'content': 'common words'})
+    store.update_note({'id': 2, 'tag': ['dinner'], 'content': 'common but rare'})
+
+    plan = store.plan(terms=['common', 'rare'], tags=['dinner'])
+
+    assert [(step.key, step.estimate) for step in plan] == [('rare', 1), ('common', 2), ('dinner', 2)]
+    assert store.match_notes(terms=['common', 'rare'], tags=['dinner']) == [2]
+
+
+def test_memory_store_update_reposts_only_the_changed_words_and_tags():
+    store = MemoryNotesStore()
+    store.update_note({'id': 1, 'tag': ['dinner', 'Pie'], 'content': 'Sweet Potato Pie'})
+    potato_ids = store._term_postings['potato']
+
+    store.update_note({'id': 1, 'tag': ['Pie', 'dessert'], 'content': 'Sweet Potato Tart'})
+
+    assert store._term_postings['potato'] is potato_ids
+    assert store._terms == ['potato', 'sweet', 'tart']
+    assert store._tags == ['dessert', 'pie']
+    assert store.match_notes(['tart'], ['pie']) == [1]
+
+
+def test_memory_store_keeps_postings_in_compact_posting_lists_and_loads_older_snapshots(tmpdir):
+    path = str(tmpdir.join('notes.snapshot'))
+    store = MemoryNotesStore()
+    store.update_note({'id': 7, 'tag': ['pie'], 'content': 'Sweet Potato Pie'})
+    assert isinstance(store._term_postings['potato'], PostingList)
+
+    with open(path, 'wb') as snapshot:
+        pickle.dump((store._notes, {'potato': set([7])}, {'pie': set([7])}), snapshot, pickle.HIGHEST_PROTOCOL)
+
+    assert MemoryNotesStore(path).match_notes(['potato'], ['pie']) == [7]
+
+
+def test_memory_store_pages_by_id_and_by_recency():
+    store = MemoryNotesStore()
+    for id in (4, 2, 3, 1):
+        store.update_note({'id': id, 'content': 'potato'})
+    store.update_note({'id': 3, 'tag': ['pie']})
+
+    assert store.match_notes(['pot*'], page=Page('id', 1, 0, 2)) == [2, 3]
+    assert store.match_notes(['potato'], page=Page('recent', None, 0, 3)) == [3, 1, 2]
+
+
+def test_memory_store_merges_the_first_matches_of_a_prefix_and_caps_its_estimate():
+    store = MemoryNotesStore()
+    for id, content in enumerate(['pan', 'pot', 'pie', 'pot pie', 'plum', 'pear', 'tart'], 1):
+        store.update_note({'id': id, 'content': content})
+
+    assert store.match_notes(['p*'], page=Page('id', 2, 0, 3)) == [3, 4, 5]
+    assert store.plan(['p*'])[0].estimate == 7
+
+    store.max_prefix_expansion = 2
+    assert store.plan(['p*'])[0].estimate == 7
+    assert store.match_notes(['p*'], page=Page('id', 2, 0, 3)) == [3, 4, 5]
+
+
+def test_memory_store_logs_changes_by_revision_across_snapshots(tmpdir):
+    path = str(tmpdir.join('notes.snapshot'))
+    store = MemoryNotesStore(path)
+    store.update_note({'id': 1, 'content': 'potato'})
+    store.update_note({'id': 2, 'content': 'pie'})
+    revision = store.last_revision()
+    store.update_note({'id': 1, 'tag': ['dinner']})
+    store.delete_note(2)
+    store.close()
+
+    store = MemoryNotesStore(path)
+    assert store.last_revision() > revision
+    assert sorted(store.changes_since(revision)) == [1, 2]
+    assert store.fetch_notes([1, 2]) == {1: {'id': 1, 'content': 'potato', 'tag': ['dinner']}}
+
+
+def test_memory_store_streams_matches_in_id_order():
+    store = MemoryNotesStore()
+    store.stream_chunk_size = 2
+    for id in (5, 1, 4, 2, 3):
+        store.update_note({'id': id, 'content': 'potato', 'tag': ['pie'] if id % 2 else []})
+
+    assert list(store.iter_matches(['pot*'])) == [1, 2, 3, 4, 5]
+    assert list(store.iter_matches(['potato'], ['pie'], after=1)) == [3, 5]
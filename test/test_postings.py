@@ -0,0 +1,42 @@
+import pickle
+
+from notes.postings import PostingList
+
+
+def test_posting_list_keeps_ids_sorted_and_unique_in_a_compact_array():
+    ids = PostingList([5, 3, 9, 3])
+    ids.add(7)
+    ids.add(5)
+    ids.discard(3)
+    ids.discard(4)
+
+    assert list(ids) == [5, 7, 9]
+    assert len(ids) == 3
+    assert 7 in ids and 3 not in ids
+    assert ids.typecode == 'I'
+    assert not PostingList()
+
+
+def test_posting_list_widens_its_array_for_ids_that_do_not_fit():
+    ids = PostingList([1, 2])
+    ids.add(2 ** 40)
+    ids.add(-1)
+
+    assert list(ids) == [-1, 1, 2, 2 ** 40]
+    assert 2 ** 40 in ids
+
+
+def test_posting_list_intersection_gallops_through_the_longer_list():
+    broad = PostingList(range(0, 100000, 3))
+    narrow = PostingList([0, 4, 9, 300, 99999, 100002])
+
+    assert list(broad.intersection(narrow)) == [0, 9, 300, 99999]
+    assert list(narrow.intersection(broad)) == [0, 9, 300, 99999]
+    assert list(narrow.intersection(PostingList())) == []
+
+
+def test_posting_list_union_merges_without_duplicates_and_pickles():
+    merged = PostingList.union([PostingList([1, 5]), PostingList([2, 5, 8])])
+
+    assert list(merged) == [1, 2, 5, 8]
+    assert pickle.loads(pickle.dumps(merged, pickle.HIGHEST_PROTOCOL)) == merged
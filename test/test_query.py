@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from notes.base import Page
+from notes.query import Query, QueryCache, parse_query
+
+
+def test_parse_query_normalizes_terms_tags_and_page_options():
+    query = parse_query("Pot* we're tag:Dinner potato tag:pan* limit:5 SORT:recent")
+
+    assert query.terms == ('pot*', 'potato', "we're")
+    assert query.tags == ('dinner', 'pan*')
+    assert query.page == Page('recent', None, 0, 5)
+    assert query.keys == (('term', 'pot', True), ('term', 'potato', False), ('term', "we're", False),
+                          ('tag', 'dinner', False), ('tag', 'pan', True))
+
+
+def test_parse_query_treats_equivalent_criteria_as_the_same_query():
+    assert parse_query('potato tag:pie') == parse_query('tag:PIE  Potato potato')
+    assert parse_query('potato') != parse_query('potato limit:1')
+
+
+def test_parse_query_decodes_utf8_criteria_before_lowercasing_them():
+    query = parse_query(u'CAFÉ tag:Été'.encode('utf-8'))
+
+    assert query.terms == (u'café',)
+    assert query.tags == (u'été',)
+
+
+def test_query_cache_parses_each_distinct_criteria_string_once(mocker):
+    parse = mocker.patch('notes.query.parse_query', side_effect=parse_query)
+    queries = QueryCache(size=2)
+
+    first = queries.parse('potato tag:pie')
+    assert queries.parse('potato tag:pie') is first
+    assert isinstance(first, Query)
+    queries.parse('pie')
+    queries.parse('tart')
+    queries.parse('potato tag:pie')
+
+    assert parse.call_count == 4
@@ -0,0 +1,126 @@
+import errno
+import socket
+import time
+from io import BytesIO
+from threading import Thread, active_count
+
+from pytest import raises
+
+from notes.client import forward, parse_address
+from notes.server import NotesServer, _ConnectionHandler, _Pending
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def _start(address, path):
+    server = NotesServer(address, path, readers=4)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, thread
+
+
+def _stop(server, thread):
+    server.shutdown()
+    thread.join()
+
+
+def _exchange(address, request, expected_lines):
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    client = socket.socket(family, socket.SOCK_STREAM)
+    client.connect(address)
+    client.sendall(request.encode('utf-8'))
+    client.shutdown(socket.SHUT_WR)
+    responses = client.makefile('rb').read().decode('utf-8').splitlines()
+    client.close()
+    assert len(responses) == expected_lines
+    return responses
+
+
+class _Handler(_ConnectionHandler):
+    def __init__(self):
+        pass
+
+
+def test_parse_address_accepts_tcp_and_unix_socket_addresses():
+    assert parse_address('127.0.0.1:8765') == ('127.0.0.1', 8765)
+    assert parse_address(':8765') == ('', 8765)
+    assert parse_address('unix:/tmp/notes.sock') == '/tmp/notes.sock'
+
+
+def test_server_answers_pipelined_commands_in_order_and_reads_its_own_writes(tmpdir):
+    server, thread = _start(('127.0.0.1', 0), str(tmpdir.join('notes.db')))
+    try:
+        responses = _exchange(server.address,
+                              'CREATE\n{"id": "1", "tag": ["dinner"], "content": "Sweet Potato Pie"}\n'
+                              'SEARCH\npotato\n'
+                              'CREATE\n{"id": "2", "content": "potato salad"}\n'
+                              'SEARCH\npotato\n'
+                              'SEARCH\ntag:dinner\n'
+                              'CREATE\nnot json\n'
+                              'FROBNICATE\nwhatever\n', 5)
+    finally:
+        _stop(server, thread)
+
+    assert responses[0] == '1'
+    assert sorted(responses[1].split(', ')) == ['1', '2']
+    assert responses[2] == '1'
+    assert responses[3].startswith('ERROR ')
+    assert responses[4] == "ERROR unknown command 'FROBNICATE'"
+
+
+def test_server_serves_many_concurrent_searchers_on_a_unix_socket(tmpdir):
+    server, thread = _start(str(tmpdir.join('notes.sock')), str(tmpdir.join('notes.db')))
+    try:
+        _exchange(server.address, ''.join('CREATE\n{{"id": "{0}", "content": "shared words"}}\n'.format(n)
+                                          for n in range(1, 21)), 0)
+        results = []
+        clients = [Thread(target=lambda: results.append(_exchange(server.address, 'SEARCH\nshared\n' * 10, 10)))
+                   for n in range(8)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    finally:
+        _stop(server, thread)
+
+    assert len(results) == 8
+    assert all(sorted(int(id) for id in line.split(', ')) == list(range(1, 21))
+               for responses in results for line in responses)
+
+
+def test_client_forwards_command_lines_and_copies_back_every_response(tmpdir):
+    server, thread = _start(str(tmpdir.join('notes.sock')), str(tmpdir.join('notes.db')))
+    output = StringIO()
+    try:
+        forward(server.address, ['CREATE\n', '{"id": "1", "content": "potato"}\n', 'SEARCH\n', 'potato\n',
+                                 'SEARCH\n', 'kettle\n'], output)
+    finally:
+        _stop(server, thread)
+
+    assert output.getvalue() == '1\n\n'
+
+
+def test_server_stops_reading_requests_when_the_client_goes_away(mocker):
+    def submit(command, argument):
+        pending = _Pending()
+        pending.finish('1')
+        return pending
+
+    handler = _Handler()
+    handler.server = mocker.Mock(**{'notes.pipeline_depth': 1, 'notes.submit.side_effect': submit})
+    handler.rfile = BytesIO(b'SEARCH\npotato\n' * 10)
+    handler.wfile = mocker.Mock(**{'write.side_effect': socket.error(errno.EPIPE, 'Broken pipe')})
+    threads = active_count()
+
+    with raises(socket.error):
+        handler.handle()
+
+    deadline = time.time() + 5
+    while active_count() > threads and time.time() < deadline:
+        time.sleep(0.01)
+    assert active_count() == threads
+    assert handler.server.notes.submit.call_count < 10
@@ -0,0 +1,102 @@
+import json
+import os
+
+from notes.api import NotesAPI
+from notes.shards import ShardedNotesStore, count_shards, rebalance, shard_path
+from notes.store import NotesStore
+
+
+NOTES = [
+    {'id': 1, 'content': 'Sweet Potato Pie', 'tag': ['dessert', 'Pie']},
+    {'id': 2, 'content': 'Mash four potatoes together', 'tag': ['dinner']},
+    {'id': 3, 'content': 'Pot: Kettle; Kettle: Pot', 'tag': ['proverb']},
+    {'id': 4, 'content': "We're going to the circus!", 'tag': ['dinner', 'plans']},
+    {'id': 5, 'content': 'potato pancakes for dinner', 'tag': ['pancake', 'dinner']},
+]
+
+QUERIES = ['potato', 'pot* limit:2 offset:1', 'pot* sort:recent limit:2', 'pot*', 'pot* kettle', 'tag:dinner', 'tag:pan* pot*', "we're", 'tag:pie sweet', 'nothing']
+
+
+def test_sharded_store_routes_notes_by_id_and_matches_the_unsharded_store(tmpdir):
+    path = str(tmpdir.join('notes.db'))
+    sharded = NotesAPI(path, backend='sharded', shards=3)
+    single = NotesAPI(str(tmpdir.join('single.db')))
+    try:
+        for api in (sharded, single):
+            for note in NOTES:
+                api.create(json.dumps(note))
+            api.delete('3')
+
+        for query in QUERIES:
+            assert sharded.search(query) == single.search(query)
+            assert list(sharded.search_stream(query)) == single.search(query)
+        assert sharded.search_many(QUERIES) == single.search_many(QUERIES)
+    finally:
+        sharded.close()
+        single.close()
+
+    assert count_shards(path) == 3
+    shard = NotesStore(shard_path(path, 2))
+    assert [note['id'] for note in shard.notes()] == [2, 5]
+    shard.close()
+
+
+def test_sharded_store_refuses_a_different_shard_count_until_rebalanced(tmpdir):
+    path = str(tmpdir.join('notes.db'))
+    store = ShardedNotesStore(path, shards=2)
+    for note in NOTES:
+        store.update_note(note)
+    store.close()
+
+    try:
+        ShardedNotesStore(path, shards=4)
+        assert False, 'expected ValueError'
+    except ValueError:
+        pass
+
+    rebalance(path, 4)
+
+    assert count_shards(path) == 4
+    assert not os.path.isfile(shard_path(path, 0, suffix='.rebalance'))
+    store = ShardedNotesStore(path)
+    try:
+        assert store.shards == 4
+        notes = sorted(store.dump(), key=lambda note: note['id'])
+        assert [dict(note, revision=None) for note in notes] == [
+            dict(note, tag=sorted(note['tag']), revision=None) for note in NOTES]
+        assert store.match_notes(['potato']) == [1, 5]
+        assert store.match_notes(tags=['pan*']) == [5]
+    finally:
+        store.close()
+
+
+def test_rebalance_shards_a_plain_database_and_leaves_it_in_place(tmpdir):
+    path = str(tmpdir.join('notes.db'))
+    store = NotesStore(path)
+    for note in NOTES:
+        store.update_note(note)
+    store.close()
+
+    rebalance(path, 2)
+
+    assert os.path.isfile(path)
+    assert count_shards(path) == 2
+    store = ShardedNotesStore(path)
+    try:
+        assert store.match_notes(['pot*']) == [1, 2, 3, 5]
+    finally:
+        store.close()
+
+
+def test_rebalance_keeps_the_revisions_that_order_recent_notes(tmpdir):
+    path = str(tmpdir.join('notes.db'))
+    with NotesAPI(path) as api:
+        for id in (3, 1, 2):
+            api.create(json.dumps({'id': id, 'content': 'potato'}))
+        api.update(json.dumps({'id': 1, 'content': 'potato pie'}))
+        assert api.search('potato sort:recent') == [1, 2, 3]
+
+    rebalance(path, 2)
+
+    with NotesAPI(path, backend='sharded') as api:
+        assert api.search('potato sort:recent') == [1, 2, 3]
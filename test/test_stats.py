@@ -0,0 +1,54 @@
+from notes.api import NotesAPI
+from notes.stats import NULL_STATS, Stats
+
+
+def test_stats_count_and_time_named_phases():
+    stats = Stats()
+    with stats.timer('store.plan'):
+        pass
+    with stats.timer('store.plan'):
+        pass
+
+    assert stats.counts['store.plan'] == 2
+    assert stats.seconds['store.plan'] >= 0
+    assert stats.report()[1].startswith('store.plan')
+
+
+def test_null_stats_record_nothing():
+    with NULL_STATS.timer('store.plan'):
+        pass
+    with NULL_STATS.search(['potato'], []) as trace:
+        trace.append(('step', 1))
+
+    assert NULL_STATS.report() == []
+
+
+def test_api_stats_cover_commands_and_store_phases(clear_db):
+    clear_db()
+
+    with NotesAPI(stats=True) as api:
+        api.create('{"id": "1", "tag": ["dinner"], "content": "Sweet Potato Pie"}')
+        api.update('{"id": "1", "tag": ["lunch"]}')
+        api.search('potato tag:lunch')
+
+        counts = api.stats.counts
+        assert counts['api.create'] == 1
+        assert counts['api.update'] == 1
+        assert counts['api.search'] == 1
+        assert counts['store.match'] == 1
+        assert counts['store.plan'] == 1
+        assert counts['store.fetch'] == 2
+        assert counts['store.tag_cleanup'] == 2
+
+
+def test_api_logs_searches_slower_than_the_threshold_with_their_plan(clear_db, mocker):
+    clear_db()
+    warning = mocker.patch('notes.stats.slow_search_log.warning')
+
+    with NotesAPI(slow_search_ms=0) as api:
+        api.create('{"id": "1", "tag": ["dinner"], "content": "Sweet Potato Pie"}')
+        api.search('potato tag:din*')
+
+    args = warning.call_args[0]
+    assert args[0].startswith('slow search')
+    assert args[-1] == 'term potato ~1 -> 1 candidates; tag din* ~1 -> 1 candidates'
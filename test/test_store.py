@@ -1,6 +1,8 @@
+# -*- coding: utf-8 -*-
 import os
 
-from notes.store import NotesStore, notes_store_session
+from notes.base import Page, PlanStep
+from notes.store import NotesStore, NotesStorePool, notes_store_session
 
 
 def test_store_initializes_schema_when_file_not_present(clear_db, table_columns):
@@ -36,6 +38,56 @@ def test_store_initializes_schema_when_file_not_present(clear_db, table_columns)
     assert any(col['name'] == 'note_id' for col in cols)
     assert any(col['name'] == 'tag_id' for col in cols)
 
+    cols = table_columns('notes_terms')
+    assert any(col['name'] == 'term' for col in cols)
+    assert any(col['name'] == 'note_id' for col in cols)
+
+
+def test_store_migrates_a_database_created_with_the_original_schema(clear_db, notes_cursor):
+    clear_db()
+    cursor = notes_cursor()
+    cursor.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, content TEXT)')
+    cursor.execute('CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, value TEXT NOT NULL)')
+    cursor.execute('CREATE TABLE notes_tags (note_id INTEGER NOT NULL, tag_id INTEGER NOT NULL)')
+    cursor.execute("INSERT INTO notes (id, content) VALUES (7, 'Sweet Potato Pie')")
+    cursor.execute("INSERT INTO notes (id, content) VALUES (8, 'Potato Pancake')")
+    cursor.execute("INSERT INTO tags (id, value) VALUES (1, 'dinner'), (2, 'dinner'), (3, 'pie')")
+    cursor.execute('INSERT INTO notes_tags (note_id, tag_id) VALUES (7, 1), (8, 2), (7, 3)')
+    cursor.connection.commit()
+
+    with notes_store_session() as store:
+        assert sorted(store.match_notes(['potato'])) == [7, 8]
+        assert sorted(store.match_notes(tags=['dinner'])) == [7, 8]
+        assert store.match_notes(['potato'], ['pie']) == [7]
+
+    assert next(notes_cursor().execute('PRAGMA user_version'))[0] == NotesStore.schema_version
+    assert sorted(row[0] for row in notes_cursor().execute('SELECT value FROM tags')) == ['dinner', 'pie']
+
+
+def test_store_keeps_one_row_per_distinct_tag_value_with_indexed_links(clear_db, notes_cursor):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'tag': ['foo', 'bar']})
+        store.update_note({'id': 2, 'tag': ['foo', 'foo']})
+
+    assert len(list(notes_cursor().execute('SELECT * FROM tags'))) == 2
+    assert len(list(notes_cursor().execute('SELECT * FROM notes_tags'))) == 3
+    indexes = [row[1] for row in notes_cursor().execute('PRAGMA index_list("notes_tags")')]
+    assert 'notes_tags_note_id' in indexes
+    assert 'notes_tags_tag_id' in indexes
+
+
+def test_store_pool_hands_out_distinct_stores_up_to_its_size_and_reuses_them(tmpdir):
+    pool = NotesStorePool(str(tmpdir.join('pooled.db')), size=2)
+
+    with pool.session() as first:
+        with pool.session() as second:
+            assert first is not second
+    with pool.session() as again:
+        assert again in (first, second)
+
+    pool.close()
+
 
 def test_store_update_creates_note_record(clear_db, notes_cursor):
     expected_id = 1
@@ -129,6 +181,23 @@ def test_store_update_deletes_tags_that_are_no_longer_used(clear_db, notes_curso
     assert len(list(notes_cursor().execute('SELECT * FROM tags'))) == 0
 
 
+def test_store_commits_writes_in_batches_and_before_searching(clear_db, notes_cursor):
+    clear_db()
+    store = NotesStore(batch_size=3)
+    store.update_note({'id': 1, 'tag': ['foo', 'bar'], 'content': 'batched'})
+    store.delete_note(1)
+
+    assert len(list(notes_cursor().execute('SELECT * FROM tags'))) == 0
+    store.update_note({'id': 2, 'tag': ['foo', 'bar'], 'content': 'batched'})
+    assert len(list(notes_cursor().execute('SELECT * FROM notes_tags'))) == 2
+
+    store.update_note({'id': 3, 'content': 'batched'})
+    assert len(list(notes_cursor().execute('SELECT * FROM notes'))) == 1
+    assert sorted(store.match_notes(['batched'])) == [2, 3]
+    assert len(list(notes_cursor().execute('SELECT * FROM notes'))) == 2
+    store.close()
+
+
 def test_store_delete_removes_note(clear_db, notes_cursor):
     clear_db()
 
@@ -170,6 +239,38 @@ def test_store_matches_an_exact_word_in_content_without_case_sensitivity(clear_d
     assert actual[0] == expected
 
 
+def test_store_matches_words_with_apostrophes_and_ignores_surrounding_punctuation(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'content': "We're going to the circus!"})
+        store.update_note({'id': 2, 'content': 'Were you there? (circus)'})
+        assert store.match_notes(["we're"]) == [1]
+        assert sorted(store.match_notes(['circus'])) == [1, 2]
+
+
+def test_store_matches_whole_non_ascii_words_without_case_sensitivity(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'content': u'Café au lait'})
+        store.update_note({'id': 2, 'content': u'ПРИВЕТ, мир'})
+        assert store.match_notes(['caf']) == []
+        assert store.match_notes([u'café']) == [1]
+        assert store.match_notes([u'привет']) == [2]
+        assert store.match_notes([u'ми*']) == [2]
+
+
+def test_store_reindexes_content_on_update_and_forgets_it_on_delete(clear_db, notes_cursor):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'content': 'old words'})
+        store.update_note({'id': 1, 'content': 'new words'})
+        assert store.match_notes(['old']) == []
+        assert store.match_notes(['new']) == [1]
+        store.delete_note(1)
+
+    assert len(list(notes_cursor().execute('SELECT * FROM notes_terms'))) == 0
+
+
 def test_store_matches_a_word_prefix_in_content(clear_db):
     clear_db()
     with notes_store_session() as store:
@@ -208,6 +309,35 @@ def test_store_matches_an_exact_tag_name_without_case_sensitivity(clear_db):
     assert actual[0] == expected
 
 
+def test_store_matches_non_ascii_tags_without_case_sensitivity(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'tag': [u'Été'], 'content': 'summer'})
+        store.update_note({'id': 2, 'tag': [u'ÉTAGE'], 'content': 'floor'})
+        assert store.match_notes(tags=[u'été']) == [1]
+        assert sorted(store.match_notes(tags=[u'ét*'])) == [1, 2]
+
+
+def test_store_migrates_tags_to_python_lowercased_values(clear_db, notes_cursor):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'tag': [u'Été']})
+    cursor = notes_cursor()
+    cursor.execute('DROP INDEX tags_lower_value')
+    cursor.execute('CREATE TABLE v5_tags (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)')
+    cursor.execute('INSERT INTO v5_tags (id, value) SELECT id, value FROM tags')
+    cursor.execute('DROP TABLE tags')
+    cursor.execute('ALTER TABLE v5_tags RENAME TO tags')
+    cursor.execute('CREATE INDEX tags_lower_value ON tags (LOWER(value))')
+    cursor.execute('PRAGMA user_version = 5')
+    cursor.connection.commit()
+
+    with notes_store_session() as store:
+        assert store.match_notes(tags=[u'été']) == [1]
+
+    assert list(notes_cursor().execute('SELECT value, lower_value FROM tags')) == [(u'Été', u'été')]
+
+
 def test_store_matches_tag_prefix(clear_db):
     clear_db()
 
@@ -247,3 +377,225 @@ def test_store_matches_combinations_of_tags_and_content_terms(clear_db):
 
     assert len(set(actual)) == 1
     assert actual[0] == expected
+
+
+def test_store_plans_the_rarest_term_first_and_stops_at_an_empty_intersection(clear_db, mocker):
+    clear_db()
+    with notes_store_session() as store:
+        for id in range(1, 6):
+            store.update_note({'id': id, 'tag': ['dinner'], 'content': 'common words'})
+        store.update_note({'id': 6, 'tag': ['dinner'], 'content': 'common but rare'})
+
+        plan = store.plan(terms=['common', 'rare'], tags=['din*'])
+        assert [(step.field, step.key, step.estimate) for step in plan] == \
+            [('term', 'rare', 1), ('term', 'common', 6), ('tag', 'din', 6)]
+        assert store.match_notes(terms=['common', 'rare'], tags=['din*']) == [6]
+
+        matching_ids = mocker.spy(store, '_matching_ids')
+        assert store.match_notes(terms=['common', 'missing']) == []
+        assert matching_ids.call_count == 1
+
+
+def test_store_explains_the_chosen_plan(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'tag': ['dinner'], 'content': 'potato pie'})
+        store.update_note({'id': 2, 'content': 'potato salad'})
+
+        assert store.explain(terms=['potato', 'pie'], tags=['din*']) == [
+            '1. term pie (estimated 1 notes)',
+            '2. tag din* (estimated 1 notes)',
+            '3. term potato (estimated 2 notes)',
+        ]
+
+
+
+def test_store_update_touches_only_the_changed_terms_and_tags(clear_db, notes_cursor):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'tag': ['dinner', 'pie'], 'content': 'Sweet Potato Pie'})
+        store.update_note({'id': 2, 'tag': ['dinner'], 'content': 'Mash potatoes'})
+        pie_id = next(store.sql.execute("SELECT id FROM tags WHERE value = 'pie'"))[0]
+        pie_link = next(store.sql.execute('SELECT rowid FROM notes_tags WHERE note_id = 1 AND tag_id = ?', (pie_id,)))
+
+        changes = store.sql.total_changes
+        store.update_note({'id': 1, 'tag': ['pie', 'dinner'], 'content': 'Sweet Potato Pie'})
+        assert store.sql.total_changes == changes
+
+        store.update_note({'id': 1, 'tag': ['pie', 'dessert'], 'content': 'Sweet Potato Tart'})
+        assert next(store.sql.execute('SELECT rowid FROM notes_tags WHERE note_id = 1 AND tag_id = ?',
+                                      (pie_id,))) == pie_link
+
+    assert sorted(row[0] for row in notes_cursor().execute('SELECT value FROM tags')) == [u'dessert', u'dinner', u'pie']
+    assert next(notes_cursor().execute("SELECT id FROM tags WHERE value = 'pie'"))[0] == pie_id
+    assert sorted(notes_cursor().execute('SELECT note_id, value FROM notes_tags, tags WHERE tag_id = tags.id')) == [
+        (1, u'dessert'), (1, u'pie'), (2, u'dinner')]
+    assert sorted(row[0] for row in notes_cursor().execute('SELECT term FROM notes_terms WHERE note_id = 1')) == [
+        u'potato', u'sweet', u'tart']
+
+
+def test_store_matches_many_queries_resolving_each_shared_term_once(clear_db, mocker):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'tag': ['dinner'], 'content': 'potato pie'})
+        store.update_note({'id': 2, 'tag': ['lunch'], 'content': 'potato soup'})
+        store.update_note({'id': 3, 'tag': ['dinner'], 'content': 'pot roast'})
+
+        matching_ids = mocker.spy(store, '_matching_ids')
+        results = store.match_many([(['potato'], ['dinner']), (['pot*'], []), (['potato'], ['lunch']),
+                                    (['missing', 'potato'], []), ([], ['din*'])])
+
+        assert [sorted(ids) for ids in results] == [[1], [1, 2, 3], [2], [], [1, 3]]
+        assert matching_ids.call_count == 6
+
+
+def test_store_pages_through_matches_in_id_order_stopping_at_the_limit(clear_db, mocker):
+    clear_db()
+    with notes_store_session() as store:
+        for id in (9, 3, 7, 1, 5):
+            store.update_note({'id': id, 'tag': ['dinner'], 'content': 'potato potatoes'})
+        store.update_note({'id': 4, 'tag': ['lunch'], 'content': 'potato'})
+
+        matching_ids = mocker.spy(store, '_matching_ids')
+        assert store.match_notes(['pot*'], page=Page('id', None, 0, 2)) == [1, 3]
+        assert store.match_notes(['pot*'], page=Page('id', 3, 0, 2)) == [4, 5]
+        assert matching_ids.call_count == 0
+
+        assert store.match_notes(['potato'], ['dinner'], page=Page('id', 1, 1, 2)) == [5, 7]
+        assert store.match_notes(['potato']) == [1, 3, 4, 5, 7, 9]
+
+
+def test_store_orders_matches_by_recency_of_create_or_update(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        for id in (1, 2, 3):
+            store.update_note({'id': id, 'content': 'potato'})
+        store.update_note({'id': 2, 'content': 'potato pie'})
+        store.update_note({'id': 1, 'content': 'potato'})
+
+        assert store.match_notes(['potato'], page=Page('recent', None, 0, None)) == [2, 3, 1]
+        assert store.match_notes(['potato'], page=Page('recent', None, 1, 1)) == [3]
+
+
+def test_store_prepares_each_statement_shape_once(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'tag': ['dinner'], 'content': 'potato pie'})
+        store.match_notes(['potato'], ['din*'])
+
+        statements = dict(NotesStore._statements)
+        assert store.match_notes(['pie'], ['lunch*']) == []
+        assert NotesStore._statements == statements
+
+
+def test_store_keeps_a_vocabulary_of_terms_with_their_note_counts(clear_db, notes_cursor):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'content': 'potato pie'})
+        store.update_note({'id': 2, 'content': 'potato soup'})
+        store.update_note({'id': 2, 'content': 'pot roast'})
+        store.delete_note(1)
+
+        assert store.plan(['pot*', 'roast']) == [
+            PlanStep('term', 'pot', True, 1), PlanStep('term', 'roast', False, 1)]
+
+    assert list(notes_cursor().execute('SELECT term, notes FROM vocabulary ORDER BY term')) == [
+        (u'pot', 1), (u'roast', 1)]
+
+
+def test_store_expands_a_short_prefix_into_terms_to_find_the_first_matches(clear_db, mocker):
+    clear_db()
+    with notes_store_session() as store:
+        for id, content in enumerate(['pan', 'pot', 'pie', 'pot pie', 'plum', 'pear', 'tart'], 1):
+            store.update_note({'id': id, 'content': content})
+
+        assert store.match_notes(['p*'], page=Page('id', 2, 0, 3)) == [3, 4, 5]
+
+        store.max_prefix_expansion = 2
+        assert store.plan(['p*'])[0].estimate == NotesStore.estimate_limit
+        assert store.match_notes(['p*'], page=Page('id', 2, 0, 3)) == [3, 4, 5]
+        assert store.match_notes(['p*', 'pie']) == [3, 4]
+
+
+def test_store_logs_creates_updates_and_deletes_by_revision(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        store.update_note({'id': 1, 'content': 'potato'})
+        store.update_note({'id': 2, 'content': 'pie', 'tag': ['dinner']})
+        revision = store.last_revision()
+        assert store.changes_since(revision) == []
+
+        store.update_note({'id': 2, 'content': 'pie'})
+        assert store.changes_since(revision) == []
+        store.update_note({'id': 3, 'content': 'kettle'})
+        store.update_note({'id': 2, 'tag': []})
+        store.delete_note(1)
+        store.delete_note(9)
+
+        assert sorted(store.changes_since(revision)) == [1, 2, 3]
+        assert store.last_revision() > revision
+        assert store.fetch_notes([1, 2, 3]) == {2: {'id': 2, 'content': 'pie', 'tag': []},
+                                                3: {'id': 3, 'content': 'kettle', 'tag': []}}
+
+
+def test_store_streams_matches_in_id_order_one_chunk_at_a_time(clear_db):
+    clear_db()
+    with notes_store_session() as store:
+        for id in range(1, 31):
+            store.update_note({'id': id, 'content': 'potato' if id % 2 else 'pot pie', 'tag': ['pie'] if id % 3 else []})
+        store.stream_chunk_size = 4
+
+        assert list(store.iter_matches(['pot*'])) == store.match_notes(['pot*'])
+        assert list(store.iter_matches(['pot*'], ['pie'], after=20)) == [22, 23, 25, 26, 28, 29]
+        assert list(store.iter_matches(['kettle'])) == []
+        chunks = store._matching_chunks(store.plan(['pot*'])[0], None)
+        assert [len(chunk) for chunk in chunks] == [4] * 7 + [2]
+
+
+def test_store_applies_the_pragmas_of_a_storage_profile(clear_db):
+    clear_db()
+    store = NotesStore(profile='ingest')
+    try:
+        assert next(store.sql.execute('PRAGMA journal_mode'))[0] == 'wal'
+        assert next(store.sql.execute('PRAGMA synchronous'))[0] == 0
+        assert next(store.sql.execute('PRAGMA cache_size'))[0] == -256 * 1024
+    finally:
+        store.close()
+
+    store = NotesStore(profile='safe')
+    try:
+        assert next(store.sql.execute('PRAGMA synchronous'))[0] == 2
+    finally:
+        store.close()
+
+    try:
+        NotesStore(profile='reckless')
+        assert False, 'expected ValueError'
+    except ValueError:
+        pass
+
+
+def test_store_probes_large_candidate_sets_in_parallel_with_the_same_result(clear_db, mocker):
+    clear_db()
+    store = NotesStore(probe_workers=3)
+    try:
+        for id in range(1, 201):
+            store.update_note({'id': id, 'content': 'potato' if id % 3 else 'potato pie', 'tag': ['pie'] * (id % 2)})
+        serial = [store.match_notes(['potato'], ['pie']), store.match_notes(['pie', 'potato'])]
+        store.parallel_probe_min = 10
+        store._probe_chunk_size = 7
+        probe = mocker.spy(store, '_probe')
+
+        assert [store.match_notes(['potato'], ['pie']), store.match_notes(['pie', 'potato'])] == serial
+        assert probe.call_count > 10
+    finally:
+        store.close()
+
+
+def test_store_session_commits_in_batches_of_its_batch_size(clear_db, notes_cursor):
+    clear_db()
+    with notes_store_session(batch_size=2) as store:
+        store.update_note({'id': 1, 'content': 'potato'})
+        assert list(notes_cursor().execute('SELECT id FROM notes')) == []
+        store.update_note({'id': 2, 'content': 'potato'})
+        assert sorted(notes_cursor().execute('SELECT id FROM notes')) == [(1,), (2,)]